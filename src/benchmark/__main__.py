@@ -0,0 +1,46 @@
+import argparse
+import json
+import sys
+from .runner import ENGINES, DEFAULT_THRESHOLD, run_suite, compare_results
+from .workloads import WORKLOADS
+
+
+def parse_workload(specification):
+    # Workloads are given as name or name:size
+    name, _, size = specification.partition(":")
+    if name not in WORKLOADS:
+        raise argparse.ArgumentTypeError(f"unknown workload {name}")
+    try:
+        return name, int(size) if size else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size {size}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the evaluation engines on synthetic workloads.")
+    parser.add_argument("--workloads", nargs="+", type=parse_workload, default=[(name, None) for name in WORKLOADS], metavar="NAME[:SIZE]", help=f"The workloads which are run (default: all of {', '.join(WORKLOADS)}).")
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES), default=["naive", "seminaive"], help="The engines which are benchmarked (default: naive seminaive).")
+    parser.add_argument("--repeat", type=int, default=3, help="The number of timed runs of each benchmark (default: 3).")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the random workloads (default: 0).")
+    parser.add_argument("--output", type=str, default="benchmark.json", help="The name of the file to which the results will be written (default: benchmark.json).")
+    parser.add_argument("--baseline", type=str, help="Compares the results with the results in this file.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help=f"The relative slowdown reported as a regression (default: {DEFAULT_THRESHOLD}).")
+
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    results = run_suite(args.workloads, args.engines, args.repeat, args.seed)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        comparisons = compare_results(results, baseline, args.threshold)
+        for comparison in comparisons:
+            status = "REGRESSION" if comparison["regression"] else "ok"
+            print(f"{comparison['workload']}:{comparison['size']} {comparison['engine']}: "
+                  f"{comparison['baseline']:.6f} -> {comparison['current']:.6f} seconds ({comparison['ratio']:.2f}x) {status}")
+        if any(comparison["regression"] for comparison in comparisons):
+            sys.exit(1)
@@ -0,0 +1,184 @@
+import functools
+import importlib
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from ..interpreter.scanner import Scanner
+from ..interpreter.parser import Parser
+from ..interpreter.safety import check_safety_rules, check_stratification
+from ..engine.trace import Trace
+from .workloads import WORKLOADS, generate
+
+
+# Module, fixpoint function, keyword arguments and trace support of each
+# engine. The engines are imported when they are benchmarked, so that a
+# missing optional dependency only skips its engine
+ENGINES = {
+    "naive": ("..engine.naive", "naive_fixpoint", {}, True),
+    "seminaive": ("..engine.seminaive", "semi_naive_fixpoint", {}, True),
+    "generic": ("..engine.seminaive", "semi_naive_fixpoint", {"closures": False}, True),
+    "pairwise": ("..engine.seminaive", "semi_naive_fixpoint", {"multiway": False}, True),
+    "columnar": ("..engine.columnar", "columnar_fixpoint", {}, False),
+    "sqlite": ("..engine.sql", "sql_fixpoint", {}, False),
+    "parallel": ("..engine.parallel", "parallel_semi_naive_fixpoint", {"workers": 2}, False),
+}
+
+# Relative slowdown of the median time above which a result is reported as
+# a regression
+DEFAULT_THRESHOLD = 0.2
+
+
+def parse_program(program):
+    scanner = Scanner()
+    parser = Parser(scanner)
+    parser.build_from_tables()
+    parsed = parser.parser.parse(program, lexer=scanner)
+    facts = [p for p in parsed if p.type == 'fact']
+    rules = [p for p in parsed if p.type == 'rule']
+    check_safety_rules(facts, rules)
+    check_stratification(rules)
+    return facts, rules
+
+
+def load_engine(name):
+    if name not in ENGINES:
+        raise Exception(f"Unknown engine {name}, expected one of {', '.join(ENGINES)}.")
+    module, function, kwargs, traced = ENGINES[name]
+    return functools.partial(getattr(importlib.import_module(module, __package__), function), **kwargs), traced
+
+
+def count_derived(derived):
+    return sum(sum(1 for _ in facts) for facts in derived.values())
+
+
+def run_benchmark(engine, facts, rules, repeat=3, traced=False):
+    '''
+    Runs an engine on a program several times. The times are measured
+    without tracing, and the peak memory in one more run with tracemalloc,
+    which only sees the allocations of the current process. The iterations
+    are counted in a last run with a trace of the iterations only.
+
+        Args:
+            engine (function): Fixpoint function of the engine
+            facts (list): Facts of the program
+            rules (list): Rules of the program
+            repeat (int): Number of timed runs
+            traced (Boolean): The engine takes a trace, so that its
+                              iterations can be counted
+
+        Returns:
+            result (dict): Times, peak memory, iterations and number of
+                           derived tuples
+    '''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        derived, _ = engine(facts, rules)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        engine(facts, rules)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    iterations = None
+    if traced:
+        trace = Trace(rules=False)
+        engine(facts, rules, trace=trace)
+        iterations = trace.iterations()
+
+    return {
+        "times": times,
+        "min": min(times),
+        "median": statistics.median(times),
+        "peak_memory": peak_memory,
+        "iterations": iterations,
+        "derived": count_derived(derived),
+    }
+
+
+def run_suite(workloads, engines, repeat=3, seed=0, report=print):
+    '''
+    Runs every engine on every workload.
+
+        Args:
+            workloads (list): Pairs of the name and the size of a workload,
+                              with None for the default size
+            engines (list): Names of the engines
+            repeat (int): Number of timed runs of each benchmark
+            seed (int): Seed of the random workloads
+            report (function): Called with a summary line of every result
+
+        Returns:
+            results (dict): Environment and results of the benchmarks
+    '''
+    results = []
+    for name, size in workloads:
+        facts, rules = parse_program(generate(name, size, seed))
+        if size is None:
+            size = WORKLOADS[name][1]
+        for engine_name in engines:
+            result = {"workload": name, "size": size, "engine": engine_name}
+            try:
+                engine, traced = load_engine(engine_name)
+                result.update(run_benchmark(engine, facts, rules, repeat, traced))
+                report(f"{name}:{size} {engine_name}: {result['median']:.6f} seconds, "
+                       f"{result['peak_memory'] / 2 ** 20:.1f} MB, {result['derived']} derived")
+            except Exception as e:
+                result["error"] = str(e)
+                report(f"{name}:{size} {engine_name}: failed ({e})")
+            results.append(result)
+
+    return {
+        "environment": {
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "seed": seed,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def benchmark_key(result):
+    return result["workload"], result["size"], result["engine"]
+
+
+def compare_results(results, baseline, threshold=DEFAULT_THRESHOLD):
+    '''
+    Compares the median times of the benchmarks with a stored baseline.
+
+        Args:
+            results (dict): Results of run_suite
+            baseline (dict): Results of an earlier run_suite
+            threshold (float): Relative slowdown above which a benchmark is
+                               a regression
+
+        Returns:
+            comparisons (list): Baseline time, current time, ratio and
+                                regression flag of every benchmark which
+                                succeeded in both runs
+    '''
+    baseline_results = {benchmark_key(result): result for result in baseline["results"] if "error" not in result}
+    comparisons = []
+    for result in results["results"]:
+        previous = baseline_results.get(benchmark_key(result))
+        if previous is None or "error" in result:
+            continue
+        ratio = result["median"] / previous["median"] if previous["median"] else float("inf")
+        comparisons.append({
+            "workload": result["workload"],
+            "size": result["size"],
+            "engine": result["engine"],
+            "baseline": previous["median"],
+            "current": result["median"],
+            "ratio": ratio,
+            "regression": ratio > 1 + threshold,
+        })
+    return comparisons
@@ -0,0 +1,171 @@
+import random
+
+
+# Rules of the workloads over a graph of edge facts
+LINEAR_REACHABLE = """reachable(X, Y) :- edge(X, Y).
+reachable(X, Y) :- edge(X, Z), reachable(Z, Y)."""
+
+LINEAR_PATH = """path(X, Y) :- e(X, Y).
+path(X, Y) :- e(X, Z), path(Z, Y)."""
+
+NONLINEAR_PATH = """path(X, Y) :- e(X, Y).
+path(X, Y) :- path(X, Z), path(Z, Y)."""
+
+SAME_GENERATION = """sg(X, X) :- person(X).
+sg(X, Y) :- parent(X, P), sg(P, Q), parent(Y, Q)."""
+
+MULTI_STRATUM = """p(X) :- q(X).
+p(X) :- r(X).
+q(X) :- a(X).
+q(X) :- c(X, Y), q(Y).
+r(X) :- b(X).
+r(X) :- c(X, Y), r(Y)."""
+
+SIBLINGS = """sibling(X, Y) :- parent(X, P), parent(Y, P), X != Y.
+cousin(X, Y) :- parent(X, P), parent(Y, Q), sibling(P, Q)."""
+
+TRIANGLE = """link(X, Y) :- edge(X, Y).
+link(Y, X) :- edge(X, Y).
+triangle(X, Y, Z) :- link(X, Y), link(Y, Z), link(X, Z)."""
+
+
+def edge_facts(edges, predicate="edge"):
+    return "\n".join(f"{predicate}(n{source}, n{target})." for source, target in edges)
+
+
+def chain_edges(size):
+    return [(i, i + 1) for i in range(size)]
+
+
+def tree_edges(size, fanout=2):
+    # A complete tree with size nodes, each node pointing to its children
+    return [((child - 1) // fanout, child) for child in range(1, size)]
+
+
+def grid_edges(size):
+    # A size x size grid with edges to the right and downwards
+    edges = []
+    for row in range(size):
+        for column in range(size):
+            node = row * size + column
+            if column + 1 < size:
+                edges.append((node, node + 1))
+            if row + 1 < size:
+                edges.append((node, node + size))
+    return edges
+
+
+def random_edges(size, seed=0, degree=2):
+    # An Erdos-Renyi style graph with size nodes and about degree * size edges
+    generator = random.Random(seed)
+    edges = set()
+    while len(edges) < degree * size:
+        edges.add((generator.randrange(size), generator.randrange(size)))
+    return sorted(edges)
+
+
+def power_law_edges(size, seed=0, degree=2):
+    # A preferential attachment graph, in which every new node links to
+    # degree earlier nodes chosen with probability proportional to their
+    # degree
+    generator = random.Random(seed)
+    targets = list(range(degree))
+    edges = set()
+    for node in range(degree, size):
+        for target in set(generator.choice(targets) for _ in range(degree)):
+            edges.add((node, target))
+            targets.append(target)
+        targets.extend([node] * degree)
+    return sorted(edges)
+
+
+def chain(size, seed=0):
+    return f"{edge_facts(chain_edges(size))}\n{LINEAR_REACHABLE}\n"
+
+
+def tree(size, seed=0):
+    return f"{edge_facts(tree_edges(size))}\n{LINEAR_REACHABLE}\n"
+
+
+def grid(size, seed=0):
+    return f"{edge_facts(grid_edges(size))}\n{LINEAR_REACHABLE}\n"
+
+
+def random_graph(size, seed=0):
+    return f"{edge_facts(random_edges(size, seed))}\n{LINEAR_REACHABLE}\n"
+
+
+def power_law_graph(size, seed=0):
+    return f"{edge_facts(power_law_edges(size, seed))}\n{LINEAR_REACHABLE}\n"
+
+
+def linear_path(size, seed=0):
+    # The path program of input_path.txt with a linear recursive rule
+    return f"{edge_facts(random_edges(size, seed, 1), 'e')}\n{LINEAR_PATH}\n"
+
+
+def nonlinear_path(size, seed=0):
+    # The path program of input_path.txt, whose recursive rule joins path
+    # with itself, on the same graph as linear_path
+    return f"{edge_facts(random_edges(size, seed, 1), 'e')}\n{NONLINEAR_PATH}\n"
+
+
+def siblings(size, seed=0):
+    # Siblings and cousins in a tree with fan-out 4, whose rules filter the
+    # pairs with a comparison
+    edges = tree_edges(size, 4)
+    return f"{edge_facts([(child, parent) for parent, child in edges], 'parent')}\n{SIBLINGS}\n"
+
+
+def triangle(size, seed=0):
+    # Triangles of the undirected power-law graph, whose rule body is cyclic
+    return f"{edge_facts(power_law_edges(size, seed, 4))}\n{TRIANGLE}\n"
+
+
+def same_generation(size, seed=0):
+    edges = tree_edges(size)
+    persons = "\n".join(f"person(n{node})." for node in range(size))
+    return f"{persons}\n{edge_facts([(child, parent) for parent, child in edges], 'parent')}\n{SAME_GENERATION}\n"
+
+
+def multi_stratum(size, seed=0):
+    # The program of input_asg.txt over a chain of c facts, with an a fact at
+    # the end and a b fact in the middle of the chain
+    facts = [f"a(n{size})."] + [f"b(n{size // 2})."]
+    facts.append(edge_facts(chain_edges(size), 'c'))
+    return "\n".join(facts) + f"\n{MULTI_STRATUM}\n"
+
+
+# Generators of the workloads and their default sizes
+WORKLOADS = {
+    "chain": (chain, 40),
+    "tree": (tree, 127),
+    "grid": (grid, 6),
+    "random": (random_graph, 30),
+    "power_law": (power_law_graph, 60),
+    "linear_path": (linear_path, 60),
+    "nonlinear_path": (nonlinear_path, 60),
+    "same_generation": (same_generation, 63),
+    "siblings": (siblings, 341),
+    "triangle": (triangle, 300),
+    "multi_stratum": (multi_stratum, 60),
+}
+
+
+def generate(name, size=None, seed=0):
+    '''
+    Generates the program of a workload.
+
+        Args:
+            name (str): Name of the workload
+            size (int): Size parameter of the workload, or None for its
+                        default size
+            seed (int): Seed of the random workloads
+
+        Returns:
+            program (str): Datalog program
+    '''
+    if name not in WORKLOADS:
+        raise Exception(f"Unknown workload {name}, expected one of {', '.join(WORKLOADS)}.")
+    generator, default_size = WORKLOADS[name]
+    return generator(default_size if size is None else size, seed)
@@ -0,0 +1,103 @@
+from ..model.model import Predicate
+from ..model.symbols import is_aggregate
+
+
+def has_aggregates(rule):
+    return any(is_aggregate(term) for term in rule.head.terms)
+
+
+def number_symbol(value):
+    # Integers are written as integers and decimals in their shortest form
+    return str(value) if isinstance(value, int) else repr(value)
+
+
+class GroupAggregator(object):
+    '''
+    Computes the aggregates of the head of a rule, such as the count(Y) of
+    degree(X, count(Y)) :- edge(X, Y). It stands in for the head relation
+    while the body is joined: the join emits the tuples of a head made of
+    the grouping terms followed by the aggregated variables, and every tuple
+    updates the running state of its group, so that no match of the body is
+    kept. count and sum range over all matches of the body, min and max
+    over the values of their variable.
+    '''
+    def __init__(self, rule_head, symbols):
+        self.symbols = symbols
+        self.values = symbols.values()
+        self.predicate = rule_head.predicate
+        self.layout = []
+        group_terms = []
+        self.functions = []
+        for term in rule_head.terms:
+            if is_aggregate(term):
+                self.layout.append((True, len(self.functions)))
+                self.functions.append(term.function)
+            else:
+                self.layout.append((False, len(group_terms)))
+                group_terms.append(term)
+        self.group_size = len(group_terms)
+        aggregated = [term.variable for term in rule_head.terms if is_aggregate(term)]
+        self.head = Predicate(rule_head.predicate, group_terms + aggregated, rule_head.type)
+        self.groups = {}
+
+    def initial(self, function, id):
+        if function == "count":
+            return 1
+        if function == "sum":
+            return self.number(id)
+        return id
+
+    def number(self, id):
+        rank, value = self.values[id]
+        if rank != 0:
+            raise Exception(f"Aggregate sum of {self.predicate} is applied to the constant "
+                            f"{self.symbols.symbol(id)}, which is not a number.")
+        return value
+
+    def add_new(self, fact):
+        '''
+        Folds one match of the body into the state of its group.
+
+            Args:
+                fact (tuple): Grouping terms followed by the values of the
+                              aggregated variables
+
+            Returns:
+                None
+        '''
+        key = fact[:self.group_size]
+        state = self.groups.get(key)
+        if state is None:
+            self.groups[key] = [self.initial(function, id)
+                                for function, id in zip(self.functions, fact[self.group_size:])]
+            return
+        values = self.values
+        for i, (function, id) in enumerate(zip(self.functions, fact[self.group_size:])):
+            if function == "count":
+                state[i] += 1
+            elif function == "sum":
+                state[i] += self.number(id)
+            elif function == "min":
+                if values[id] < values[state[i]]:
+                    state[i] = id
+            elif values[id] > values[state[i]]:
+                state[i] = id
+
+    def flush(self, relation):
+        '''
+        Adds a head tuple for every group to the head relation. The counts
+        and sums are new numbers, which are interned.
+
+            Args:
+                relation (VersionedRelation): Relation of the head predicate
+
+            Returns:
+                None
+        '''
+        for key, state in self.groups.items():
+            results = [self.symbols.intern(number_symbol(value)) if function in ("count", "sum") else value
+                       for function, value in zip(self.functions, state)]
+            relation.add_new(tuple(results[i] if aggregate else key[i] for aggregate, i in self.layout))
+        self.groups = {}
+        # The comparisons of later strata read the values of the new numbers
+        self.symbols.values()
@@ -0,0 +1,169 @@
+from ..model.symbols import is_variable
+
+
+# Shapes of the recursive rule of a transitive closure, by the arity of the
+# closure predicate p and the direction in which it grows
+FORWARD = "forward"      # p(X, Y) :- p(X, Z), e(Z, Y).  or  p(Y) :- p(X), e(X, Y).
+BACKWARD = "backward"    # p(X, Y) :- e(X, Z), p(Z, Y).  or  p(X) :- e(X, Y), p(Y).
+
+
+class Closure(object):
+    '''
+    A recursive stratum recognized as a transitive closure. The non-recursive
+    rules of the predicate and its base facts make up the seed relation P0,
+    and the recursive rule extends P0 along the edge relation: forward rules
+    compute P0 e*, backward rules e* P0 and the non-linear rule, whose edge
+    relation is the predicate itself, P0+.
+    '''
+    def __init__(self, predicate, edge, direction, arity):
+        self.predicate = predicate
+        self.edge = edge
+        self.direction = direction
+        self.arity = arity
+
+    def __repr__(self):
+        return "%r" % (self.__dict__)
+
+
+def distinct_variables(predicate):
+    terms = predicate.terms
+    return all(is_variable(term) for term in terms) and len(set(terms)) == len(terms)
+
+
+def recursive_shape(rule):
+    '''
+    Matches a recursive rule against the shapes of a transitive closure. The
+    two body predicates may come in either order, and the rule cannot have
+    comparisons or negated atoms, which would filter the paths.
+
+        Args:
+            rule (Rule): Rule whose body refers to its head predicate
+
+        Returns:
+            shape (tuple): Edge predicate and direction, or None if the rule
+                           has another shape
+    '''
+    head = rule.head
+    name = head.predicate
+    if len(rule.body) != 2 or rule.comparisons or rule.negations or len(head.terms) not in (1, 2) or not distinct_variables(head):
+        return None
+    if not all(distinct_variables(predicate) for predicate in rule.body):
+        return None
+    first, second = rule.body
+    recursive = [predicate for predicate in rule.body if predicate.predicate == name]
+    if len(recursive) == 2:
+        # p(X, Y) :- p(X, Z), p(Z, Y).
+        if len(head.terms) != 2 or len(first.terms) != 2 or len(second.terms) != 2:
+            return None
+        x, y = head.terms
+        for left, right in ((first, second), (second, first)):
+            (left_x, z), (right_z, right_y) = left.terms, right.terms
+            if (left_x, right_z, right_y) == (x, z, y) and z not in (x, y):
+                return name, FORWARD
+        return None
+
+    closure = recursive[0]
+    edge = second if closure is first else first
+    if len(edge.terms) != 2 or len(closure.terms) != len(head.terms):
+        return None
+    source, target = edge.terms
+    if len(head.terms) == 1:
+        # p(Y) :- p(X), e(X, Y).  or  p(X) :- e(X, Y), p(Y).
+        if closure.terms == (source,) and head.terms == (target,) and source != target:
+            return edge.predicate, FORWARD
+        if closure.terms == (target,) and head.terms == (source,) and source != target:
+            return edge.predicate, BACKWARD
+        return None
+    x, y = head.terms
+    if closure.terms == (x, source) and target == y and source not in (x, y):
+        return edge.predicate, FORWARD
+    if closure.terms == (target, y) and source == x and target not in (x, y):
+        return edge.predicate, BACKWARD
+    return None
+
+
+def recognize_closure(stratum):
+    '''
+    Recognizes a stratum which computes a transitive closure: a single unary
+    or binary predicate with exactly one recursive rule of one of the
+    closure shapes, and any number of non-recursive rules. Unary closures are
+    the reachability from a set of bound sources, such as the magic
+    predicates of a query with a bound argument.
+
+        Args:
+            stratum (Stratum): Stratum of the program
+
+        Returns:
+            closure (Closure): Recognized closure, or None if the stratum has
+                               to be evaluated by the generic engine
+    '''
+    if not stratum.recursive or len(stratum.predicates) != 1:
+        return None
+    name = next(iter(stratum.predicates))
+    recursive_rules = [rule for rule in stratum.rules
+                       if any(predicate.predicate == name for predicate in rule.body)]
+    if len(recursive_rules) != 1:
+        return None
+    shape = recursive_shape(recursive_rules[0])
+    if shape is None:
+        return None
+    edge, direction = shape
+    return Closure(name, edge, direction, len(recursive_rules[0].head.terms))
+
+
+def adjacency_lists(tuples, reverse=False):
+    adjacency = {}
+    for source, target in tuples:
+        if reverse:
+            source, target = target, source
+        successors = adjacency.get(source)
+        if successors is None:
+            adjacency[source] = [target]
+        else:
+            successors.append(target)
+    return adjacency
+
+
+def reachable(seeds, adjacency):
+    # Breadth-first search from a set of nodes, which are reached themselves
+    reached = set(seeds)
+    frontier = list(reached)
+    for node in frontier:
+        for successor in adjacency.get(node, ()):
+            if successor not in reached:
+                reached.add(successor)
+                frontier.append(successor)
+    return reached
+
+
+def evaluate_closure(closure, seeds, edges):
+    '''
+    Computes a transitive closure with a breadth-first search over adjacency
+    lists from every source of the seed relation. Backward closures search
+    the reversed edges from every target of the seed relation instead.
+
+        Args:
+            closure (Closure): Recognized closure
+            seeds (iterable): Tuples of the seed relation P0
+            edges (iterable): Tuples of the edge relation, or None for the
+                              non-linear closure, whose edges are the seeds
+
+        Returns:
+            tuples (iterable): Tuples of the closure, including the seeds
+    '''
+    reverse = closure.direction == BACKWARD
+    seeds = list(seeds)
+    adjacency = adjacency_lists(seeds if edges is None else edges, reverse)
+    if closure.arity == 1:
+        return [(node,) for node in reachable((node for node, in seeds), adjacency)]
+
+    # The seeds grouped by the end which stays fixed, the source of a forward
+    # closure and the target of a backward one
+    starts = adjacency_lists(seeds, reverse)
+    tuples = []
+    for fixed, start in starts.items():
+        if reverse:
+            tuples.extend((node, fixed) for node in reachable(start, adjacency))
+        else:
+            tuples.extend((fixed, node) for node in reachable(start, adjacency))
+    return tuples
@@ -0,0 +1,356 @@
+from bisect import bisect_left
+from .relation import OLD, DELTA, FULL
+from .planner import Statistics, plan_body
+from .seminaive import convert_to_datalog_format, delta_rules
+from .filters import OPERATORS, place_filters
+from .stratification import is_monotonic
+from ..model.symbols import SymbolTable, is_variable, term_value
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def empty_rows(arity):
+    return np.empty((0, arity), dtype=np.int64)
+
+
+def sort_rows(rows):
+    # Lexicographic order of the rows, first column most significant
+    return np.lexsort(rows.T[::-1])
+
+
+def unique_rows(rows):
+    if len(rows) < 2:
+        return rows
+    rows = rows[sort_rows(rows)]
+    keep = np.ones(len(rows), dtype=bool)
+    keep[1:] = np.any(rows[1:] != rows[:-1], axis=1)
+    return rows[keep]
+
+
+def difference_rows(rows, other):
+    '''
+    Returns the rows which do not occur in other. Both arrays must be free of
+    duplicates.
+
+        Args:
+            rows (numpy.ndarray): Rows which are to be filtered
+            other (numpy.ndarray): Rows which are to be removed
+
+        Returns:
+            rows (numpy.ndarray): Remaining rows
+    '''
+    if len(rows) == 0 or len(other) == 0:
+        return rows
+    stacked = np.concatenate([rows, other])
+    tags = np.concatenate([np.zeros(len(rows), dtype=np.int8), np.ones(len(other), dtype=np.int8)])
+    # Equal rows end up next to each other, the row of other after the row
+    # of rows since the tag is the least significant sort key
+    order = np.lexsort((tags,) + tuple(stacked.T[::-1]))
+    stacked = stacked[order]
+    tags = tags[order]
+    followed_by_equal = np.zeros(len(stacked), dtype=bool)
+    followed_by_equal[:-1] = np.all(stacked[1:] == stacked[:-1], axis=1)
+    return stacked[(tags == 0) & ~followed_by_equal]
+
+
+def join_keys(left, right):
+    # Maps the composite keys of both sides to a single integer key
+    if left.shape[1] == 1:
+        return left[:, 0], right[:, 0]
+    _, inverse = np.unique(np.concatenate([left, right]), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    return inverse[:len(left)], inverse[len(left):]
+
+
+def sort_merge_join(left_keys, right_keys):
+    '''
+    Computes the pairs of positions whose keys are equal.
+
+        Args:
+            left_keys (numpy.ndarray): Join keys of the partial matches
+            right_keys (numpy.ndarray): Join keys of the relation rows
+
+        Returns:
+            left_positions (numpy.ndarray): Positions in the partial matches
+            right_positions (numpy.ndarray): Positions in the relation rows
+    '''
+    order = np.argsort(right_keys, kind="stable")
+    sorted_keys = right_keys[order]
+    low = np.searchsorted(sorted_keys, left_keys, side="left")
+    high = np.searchsorted(sorted_keys, left_keys, side="right")
+    counts = high - low
+    total = int(counts.sum())
+    left_positions = np.repeat(np.arange(len(left_keys)), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    right_positions = order[np.repeat(low, counts) + offsets]
+    return left_positions, right_positions
+
+
+class ColumnarRelation(object):
+    '''
+    Integer-encoded rows of a relation, kept as a stable and a delta array.
+    Both arrays are free of duplicates and disjoint from each other. When the
+    rows can be packed into a single 64-bit key, the sorted keys of the stable
+    rows are kept as well, so that new rows are filtered by binary search.
+    '''
+    def __init__(self, arity, symbol_count, rows=None):
+        self.arity = arity
+        self.stable = unique_rows(rows) if rows is not None else empty_rows(arity)
+        self.delta = empty_rows(arity)
+        self.key_base = max(symbol_count, 1)
+        self.stable_keys = None
+        if self.key_base ** arity < 2 ** 63:
+            self.stable_keys = np.sort(self.keys(self.stable))
+
+    def keys(self, rows):
+        keys = np.zeros(len(rows), dtype=np.int64)
+        for column in range(self.arity):
+            keys = keys * self.key_base + rows[:, column]
+        return keys
+
+    def rows(self, version):
+        if version == OLD:
+            return self.stable
+        if version == DELTA:
+            return self.delta
+        if len(self.delta) == 0:
+            return self.stable
+        return np.concatenate([self.stable, self.delta])
+
+    def advance(self, new_rows):
+        '''
+        Merges the delta into the stable array and makes the rows of new_rows
+        which are not yet known the next delta.
+
+            Args:
+                new_rows (numpy.ndarray): Rows derived in this iteration
+
+            Returns:
+                changed (Boolean): True if the next delta is not empty
+        '''
+        if len(self.delta):
+            self.stable = np.concatenate([self.stable, self.delta])
+        new_rows = unique_rows(new_rows)
+        if self.stable_keys is None:
+            self.delta = difference_rows(new_rows, self.stable)
+            return len(self.delta) > 0
+
+        if len(self.delta):
+            # Both arrays are sorted, which the stable sort merges in linear time
+            self.stable_keys = np.sort(np.concatenate([self.stable_keys, self.keys(self.delta)]), kind="stable")
+        new_keys = self.keys(new_rows)
+        positions = np.searchsorted(self.stable_keys, new_keys)
+        known = positions < len(self.stable_keys)
+        known[known] = self.stable_keys[positions[known]] == new_keys[known]
+        self.delta = new_rows[~known]
+        return len(self.delta) > 0
+
+
+def join_predicate(bindings, size, predicate, rows):
+    '''
+    Joins the partial matches with the rows of one body predicate.
+
+        Args:
+            bindings (dict): Maps each bound variable to its column of values
+            size (int): Number of partial matches
+            predicate (Predicate): Body predicate with interned constants
+            rows (numpy.ndarray): Rows of the relation read by the predicate
+
+        Returns:
+            bindings (dict): Columns of the extended partial matches
+            size (int): Number of extended partial matches
+    '''
+    # Constants and repeated variables are applied as selections on the rows
+    mask = np.ones(len(rows), dtype=bool)
+    first_columns = {}
+    for column, term in enumerate(predicate.terms):
+        if not is_variable(term):
+            mask &= rows[:, column] == term
+        elif term in first_columns:
+            mask &= rows[:, column] == rows[:, first_columns[term]]
+        else:
+            first_columns[term] = column
+    rows = rows[mask]
+
+    shared = [variable for variable in first_columns if variable in bindings]
+    if shared:
+        left = np.stack([bindings[variable] for variable in shared], axis=1)
+        right = rows[:, [first_columns[variable] for variable in shared]]
+        left_keys, right_keys = join_keys(left, right)
+        left_positions, right_positions = sort_merge_join(left_keys, right_keys)
+    else:
+        # No shared variable, so the join is a cross product
+        left_positions = np.repeat(np.arange(size), len(rows))
+        right_positions = np.tile(np.arange(len(rows)), size)
+
+    joined = {variable: values[left_positions] for variable, values in bindings.items()}
+    for variable, column in first_columns.items():
+        if variable not in joined:
+            joined[variable] = rows[right_positions, column]
+    return joined, len(left_positions)
+
+
+class ValueRanks(object):
+    '''
+    Ranks of the typed values of the constants, so that the comparisons
+    compare whole columns of integers. Equal values get the same even rank,
+    and a constant of a comparison which is not interned gets the odd rank
+    between the ranks of its neighbours.
+    '''
+    def __init__(self, values):
+        self.distinct = sorted(set(values))
+        position = {value: i for i, value in enumerate(self.distinct)}
+        self.ranks = np.array([2 * position[value] for value in values], dtype=np.int64)
+
+    def operand(self, term, bindings):
+        if is_variable(term):
+            return self.ranks[bindings[term]]
+        value = term_value(term)
+        i = bisect_left(self.distinct, value)
+        return 2 * i if i < len(self.distinct) and self.distinct[i] == value else 2 * i - 1
+
+
+def filter_bindings(bindings, size, comparisons, ranks):
+    # The comparisons are applied as a selection on the partial matches
+    mask = np.ones(size, dtype=bool)
+    for comparison in comparisons:
+        left, right = (ranks.operand(term, bindings) for term in comparison.terms)
+        mask &= OPERATORS[comparison.operator](left, right)
+    return {variable: values[mask] for variable, values in bindings.items()}, int(mask.sum())
+
+
+def evaluate_rule(rule_head, body, relations, comparisons=(), ranks=None):
+    bindings = {}
+    size = 1
+    # Every comparison filters the partial matches as soon as its variables
+    # are bound
+    placed = place_filters([predicate.terms for predicate, _ in body], comparisons)
+    for (predicate, version), step in zip(body, placed):
+        bindings, size = join_predicate(bindings, size, predicate, relations[predicate.predicate].rows(version))
+        if step and size:
+            bindings, size = filter_bindings(bindings, size, step, ranks)
+        if size == 0:
+            return empty_rows(len(rule_head.terms))
+    columns = [bindings[term] if is_variable(term) else np.full(size, term, dtype=np.int64)
+               for term in rule_head.terms]
+    return unique_rows(np.stack(columns, axis=1))
+
+
+def collect_statistics(relations):
+    cardinalities = {}
+    for name, relation in relations.items():
+        cardinalities[(name, OLD)] = len(relation.stable)
+        cardinalities[(name, DELTA)] = len(relation.delta)
+        cardinalities[(name, FULL)] = len(relation.stable) + len(relation.delta)
+    return Statistics(cardinalities)
+
+
+def rows_to_tuples(rows):
+    return [tuple(row) for row in rows.tolist()]
+
+
+def iterate_rows(rows, chunk_size=65536):
+    # Converts the rows to tuples a chunk at a time, so that the tuples of a
+    # large relation are never all held in memory
+    for start in range(0, len(rows), chunk_size):
+        yield from map(tuple, rows[start:start + chunk_size].tolist())
+
+
+def columnar_fixpoint(base_facts, rules, verbose=False, base_relations=None):
+    '''
+    Computes the fixpoint of a program with the columnar evaluation.
+
+        Args:
+            base_facts (list): Facts of the program
+            rules (list): Rules of the program
+            verbose (Boolean): Prints the relations in every iteration
+            base_relations (dict): Maps predicates to iterables of tuples of
+                                   terms which are loaded as base facts
+
+        Returns:
+            derived (dict): Maps each IDB predicate to a generator of its
+                            derived tuples which are not base facts
+            symbols (SymbolTable): Symbol table of the interned terms
+    '''
+    if np is None:
+        raise Exception("The columnar evaluation method requires NumPy.")
+    if not is_monotonic(rules):
+        raise Exception("The columnar evaluation method does not support negation and aggregates.")
+
+    symbols = SymbolTable()
+    arities = {}
+    base_tuples = {}
+    for fact in base_facts:
+        arities[fact.fact.predicate] = len(fact.fact.terms)
+        base_tuples.setdefault(fact.fact.predicate, []).append(symbols.encode(fact.fact.terms))
+    for name, rows in (base_relations or {}).items():
+        tuples = base_tuples.setdefault(name, [])
+        for terms in rows:
+            arities[name] = len(terms)
+            tuples.append(symbols.encode(terms))
+    rules = [symbols.encode_rule(rule) for rule in rules]
+    for rule in rules:
+        for predicate in [rule.head] + rule.body:
+            arities.setdefault(predicate.predicate, len(predicate.terms))
+
+    relations = {}
+    for name, arity in arities.items():
+        rows = np.array(base_tuples[name], dtype=np.int64).reshape(-1, arity) if base_tuples.get(name) else None
+        relations[name] = ColumnarRelation(arity, len(symbols), rows)
+
+    idb_predicates = dict.fromkeys(rule.head.predicate for rule in rules)
+    base_rows = {predicate: relations[predicate].stable for predicate in idb_predicates}
+    ranks = ValueRanks(symbols.values()) if any(rule.comparisons for rule in rules) else None
+
+    def advance(derived):
+        changed = False
+        for predicate in idb_predicates:
+            new_rows = np.concatenate(derived[predicate]) if derived[predicate] else empty_rows(arities[predicate])
+            changed = relations[predicate].advance(new_rows) or changed
+        return changed
+
+    # Initialize the delta with the rows produced by the rules using the full
+    # relations, in which the IDB predicates only hold their base facts
+    statistics = collect_statistics(relations)
+    derived = {predicate: [] for predicate in idb_predicates}
+    for rule in rules:
+        body = plan_body([(predicate, FULL) for predicate in rule.body], statistics)
+        derived[rule.head.predicate].append(evaluate_rule(rule.head, body, relations, rule.comparisons, ranks))
+    changed = advance(derived)
+
+    variants = [(rule, body) for rule in rules for body in delta_rules(rule, idb_predicates)]
+
+    i = 1
+    while changed:
+        statistics = collect_statistics(relations)
+        derived = {predicate: [] for predicate in idb_predicates}
+        for rule, body in variants:
+            derived[rule.head.predicate].append(evaluate_rule(rule.head, plan_body(body, statistics), relations,
+                                                              rule.comparisons, ranks))
+
+        if verbose:
+            print(f"<---------- Iteration {i} ---------->")
+            print(f"p[{i}]:")
+            print(convert_to_datalog_format({predicate: rows_to_tuples(relations[predicate].rows(FULL))
+                                             for predicate in idb_predicates}, symbols))
+
+        changed = advance(derived)
+
+        if verbose:
+            print(f"delta(p[{i}]):")
+            print(convert_to_datalog_format({predicate: rows_to_tuples(relations[predicate].delta)
+                                             for predicate in idb_predicates}, symbols))
+
+        i += 1
+
+    derived = {predicate: iterate_rows(difference_rows(relations[predicate].stable, base_rows[predicate]))
+               for predicate in idb_predicates}
+    return derived, symbols
+
+
+def columnar_evaluation(base_facts, rules, verbose=False, base_relations=None):
+    derived, symbols = columnar_fixpoint(base_facts, rules, verbose, base_relations)
+    return convert_to_datalog_format(derived, symbols)
@@ -0,0 +1,155 @@
+from ..model.symbols import is_variable, term_value
+from .filters import PYTHON_OPERATORS, place_filters
+
+
+def generate_rule_source(rule_head, body, emit="add_new", instrumented=False, filters=(), values=None):
+    '''
+    Generates the source code of a function which evaluates one rule (or one
+    delta variant of a rule) with a fixed join order. Every variable gets a
+    local slot, every body predicate reads fixed tuple positions, and the
+    constants and the variables bound by earlier predicates form the key of
+    an index probe, so no term is inspected while tuples are joined. Each
+    comparison or negated atom is checked in the loop of the body predicate
+    which binds the last of its variables; a negated atom is a probe of the
+    hash set of the stable tuples of its relation.
+
+        Args:
+            rule_head (Predicate): Head of the rule
+            body (list): List of (predicate, version) pairs in join order
+            emit (str): Method of the head relation receiving the derived tuples
+            instrumented (Boolean): Counts the candidate tuples and the
+                                    matches of every body predicate in the
+                                    lists scanned and matches, which become
+                                    parameters of the function
+            filters (list): Comparisons and negated atoms of the rule
+            values (list): Typed values of the interned constants, which
+                           the comparisons compare
+
+        Returns:
+            source (str): Source code of a function named "rule"
+            constants (list): Constants referenced by the source as c0, c1, ...
+    '''
+    constants = []
+    slots = {}
+
+    def constant(term):
+        constants.append(term)
+        return f"c{len(constants) - 1}"
+
+    def term_expression(term):
+        return slots[term] if is_variable(term) else constant(term)
+
+    def value_expression(term):
+        # Comparisons read the typed values of the constants bound to their
+        # variables, and their own constants are never interned
+        return f"values[{slots[term]}]" if is_variable(term) else constant(term_value(term))
+
+    setup = []
+    loops = []
+    placed = place_filters([predicate.terms for predicate, _ in body], filters)
+    if any(literal.type == 'comparison' for literal in filters):
+        setup.append(f"values = {constant(values)}")
+    negated = {}
+    for literal in filters:
+        if literal.type == 'negation' and literal.predicate not in negated:
+            negated[literal.predicate] = f"negated{len(negated)}"
+            setup.append(f"{negated[literal.predicate]} = database[{literal.predicate!r}].stable.tuples")
+    for k, (predicate, version) in enumerate(body):
+        setup.append(f"parts{k} = database[{predicate.predicate!r}].parts({version!r})")
+
+        columns = []
+        key = []
+        assignments = []
+        checks = []
+        bound_variables = set(slots)
+        for column, term in enumerate(predicate.terms):
+            if not is_variable(term) or term in bound_variables:
+                columns.append(column)
+                key.append(term_expression(term))
+            elif term in slots:
+                # Repeated variable whose first occurrence is in this predicate
+                checks.append(f"if t{k}[{column}] != {slots[term]}: continue")
+            else:
+                slots[term] = f"v{len(slots)}"
+                assignments.append(f"{slots[term]} = t{k}[{column}]")
+
+        if columns:
+            setup.append(f"indexes{k} = [part.index({tuple(columns)!r}) for part in parts{k}]")
+            outer = f"for index{k} in indexes{k}:"
+            candidates = f"index{k}.get(({', '.join(key)},), ())"
+        else:
+            outer = f"for part{k} in parts{k}:"
+            candidates = f"part{k}.tuples"
+        if instrumented:
+            prologue = [f"candidates{k} = {candidates}", f"scanned[{k}] += len(candidates{k})"]
+            candidates = f"candidates{k}"
+        else:
+            prologue = []
+        for literal in placed[k]:
+            if literal.type == 'negation':
+                terms = ", ".join(term_expression(term) for term in literal.terms)
+                checks.append(f"if ({terms},) in {negated[literal.predicate]}: continue")
+            else:
+                left, right = (value_expression(term) for term in literal.terms)
+                checks.append(f"if not {left} {PYTHON_OPERATORS[literal.operator]} {right}: continue")
+        # Assignments come first, so that checks can refer to the slots
+        inner = assignments + checks + ([f"matches[{k}] += 1"] if instrumented else [])
+        loops.append((outer, prologue, f"for t{k} in {candidates}:", inner))
+
+    head = ", ".join(term_expression(term) for term in rule_head.terms)
+    lines = ["def rule(database, scanned, matches):" if instrumented else "def rule(database):"]
+    lines += ["    " + line for line in setup]
+    lines.append(f"    add_new = database[{rule_head.predicate!r}].{emit}")
+    depth = 1
+    for outer, prologue, loop, inner in loops:
+        lines.append("    " * depth + outer)
+        lines += ["    " * (depth + 1) + line for line in prologue]
+        lines.append("    " * (depth + 1) + loop)
+        lines += ["    " * (depth + 2) + line for line in inner]
+        depth += 2
+    lines.append("    " * depth + f"add_new(({head},))")
+    return "\n".join(lines) + "\n", constants
+
+
+def compile_rule(rule_head, body, emit="add_new", instrumented=False, filters=(), values=None):
+    '''
+    Compiles one rule (or one delta variant of a rule) into a Python function.
+
+        Args:
+            rule_head (Predicate): Head of the rule
+            body (list): List of (predicate, version) pairs in join order
+            emit (str): Method of the head relation receiving the derived tuples
+            instrumented (Boolean): Compiles the function with counters
+            filters (list): Comparisons and negated atoms of the rule
+            values (list): Typed values of the interned constants, which the
+                           function keeps a reference to
+
+        Returns:
+            rule (function): Function which takes the database and passes the
+                             derived tuples to the emit method of the head
+                             relation, by default adding them to its new part
+    '''
+    source, constants = generate_rule_source(rule_head, body, emit, instrumented, filters, values)
+    namespace = {f"c{i}": value for i, value in enumerate(constants)}
+    exec(compile(source, f"<rule {rule_head.predicate}>", "exec"), namespace)
+    return namespace["rule"]
+
+
+class RuleCompiler(object):
+    '''
+    Caches the compiled functions of the rules. Rules are compiled once per
+    join order, so re-planning between iterations only compiles orders which
+    have not been seen before.
+    '''
+    def __init__(self):
+        self.functions = {}
+
+    def get(self, rule_head, body, emit="add_new", instrumented=False, filters=(), values=None):
+        key = (rule_head.predicate, tuple(rule_head.terms), emit, instrumented,
+               tuple((predicate.predicate, tuple(predicate.terms), version) for predicate, version in body),
+               tuple(filters))
+        function = self.functions.get(key)
+        if function is None:
+            function = compile_rule(rule_head, body, emit, instrumented, filters, values)
+            self.functions[key] = function
+        return function
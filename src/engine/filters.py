@@ -0,0 +1,121 @@
+import operator
+from ..model.symbols import is_variable, term_value
+
+
+# Functions and Python operators of the comparison operators
+OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+PYTHON_OPERATORS = {"=": "==", "!=": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+
+
+def filter_variables(literal):
+    return {term for term in literal.terms if is_variable(term)}
+
+
+def rule_filters(rule):
+    # The comparisons and the negated atoms of a rule only filter the
+    # matches of its positive body
+    return rule.comparisons + rule.negations
+
+
+def place_filters(steps, filters):
+    '''
+    Pushes the filters of a rule (its comparisons and negated atoms) down
+    into its join: every filter is applied right after the first join step
+    which binds the last of its variables, so that it removes the partial
+    matches as early as possible. Filters without variables are applied
+    after the first step.
+
+        Args:
+            steps (list): Terms of every join step in join order, of which
+                          the variables are bound by the step
+            filters (list): Comparisons and negated atoms of the rule
+
+        Returns:
+            placed (list): For every join step, the list of filters applied
+                           after it
+    '''
+    placed = [[] for _ in steps]
+    remaining = list(filters)
+    bound_variables = set()
+    for k, terms in enumerate(steps):
+        bound_variables.update(term for term in terms if is_variable(term))
+        ready = [literal for literal in remaining if filter_variables(literal) <= bound_variables]
+        placed[k].extend(ready)
+        remaining = [literal for literal in remaining if literal not in ready]
+    if remaining:
+        raise Exception(f"Filter {remaining[0]} has a variable which is not bound by the body.")
+    return placed
+
+
+def comparison_test(comparison, values, positions=None):
+    '''
+    Builds a function which tests a comparison on a binding of its
+    variables, comparing the typed values of the bound constants.
+
+        Args:
+            comparison (Comparison): Comparison which is to be tested
+            values (list): Typed values of the interned constants
+            positions (dict): Maps the variables to their positions in the
+                              binding, or None if the binding is a dict from
+                              variables to constants
+
+        Returns:
+            test (function): Function which takes a binding and returns True
+                             if the comparison holds
+    '''
+    compare = OPERATORS[comparison.operator]
+    left, right = comparison.terms
+    if is_variable(left):
+        left = left if positions is None else positions[left]
+        if is_variable(right):
+            right = right if positions is None else positions[right]
+            return lambda binding: compare(values[binding[left]], values[binding[right]])
+        right = term_value(right)
+        return lambda binding: compare(values[binding[left]], right)
+    left = term_value(left)
+    if is_variable(right):
+        right = right if positions is None else positions[right]
+        return lambda binding: compare(left, values[binding[right]])
+    holds = compare(left, term_value(right))
+    return lambda binding: holds
+
+
+def negation_test(negation, database, positions=None):
+    '''
+    Builds a function which tests a negated atom on a binding of its
+    variables by probing the hash set of the stable tuples of its relation,
+    which is complete since the relation belongs to an earlier stratum.
+
+        Args:
+            negation (Predicate): Negated atom which is to be tested
+            database (dict): Maps predicates to their VersionedRelation
+            positions (dict): Maps the variables to their positions in the
+                              binding, or None if the binding is a dict from
+                              variables to constants
+
+        Returns:
+            test (function): Function which takes a binding and returns True
+                             if the atom has no matching tuple
+    '''
+    relation = database.get(negation.predicate)
+    if relation is None:
+        return lambda binding: True
+    tuples = relation.stable.tuples
+    slots = [(True, term if positions is None else positions[term]) if is_variable(term) else (False, term)
+             for term in negation.terms]
+    return lambda binding: tuple(binding[slot] if variable else slot for variable, slot in slots) not in tuples
+
+
+def filter_test(literal, values, database, positions=None):
+    # Builds the test of a comparison or of a negated atom
+    if literal.type == 'negation':
+        return negation_test(literal, database, positions)
+    return comparison_test(literal, values, positions)
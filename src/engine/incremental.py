@@ -0,0 +1,249 @@
+from .relation import Relation, VersionedRelation, OLD, DELTA, FULL
+from .planner import plan_body
+from .compiler import RuleCompiler
+from .stratification import stratify, is_monotonic
+from .seminaive import collect_statistics, convert_to_datalog_format, delta_rules
+from ..model.symbols import SymbolTable
+
+
+# Versions of a relation which only exist while a batch of updates is applied
+ADDED = "added"         # Tuples inserted by the current batch
+REMOVED = "removed"     # Tuples deleted by the current batch
+BEFORE = "before"       # Tuples present before the current batch of deletions
+REMOVING = "removing"   # Tuples over-deleted in the previous deletion step
+
+VERSIONS = (OLD, DELTA, FULL, ADDED, REMOVED, BEFORE, REMOVING)
+
+
+class IncrementalRelation(VersionedRelation):
+    '''
+    A versioned relation which also records the changes made to it by the
+    current batch of insertions or deletions.
+    '''
+    def __init__(self, tuples=()):
+        super().__init__(tuples)
+        self.reset()
+
+    def reset(self):
+        self.added = Relation()
+        self.removed = Relation()
+        self.removing = Relation()
+        self.next_removing = Relation()
+
+    def parts(self, version):
+        if version == ADDED:
+            return (self.added,)
+        if version == REMOVED:
+            return (self.removed,)
+        if version == REMOVING:
+            return (self.removing,)
+        if version == BEFORE:
+            # Removed tuples are taken out of the stable part, so both are
+            # disjoint
+            return (self.stable, self.removed)
+        return super().parts(version)
+
+    def mark_removed(self, fact):
+        # Over-deletes a tuple which is present and not yet over-deleted
+        if fact in self.stable and fact not in self.removed and fact not in self.removing:
+            self.next_removing.add(fact)
+
+
+class IncrementalSession(object):
+    '''
+    Keeps the materialized fixpoint of a program and maintains it under
+    batches of fact insertions and deletions. Insertions continue the
+    semi-naive evaluation with the new facts as the delta; deletions use the
+    delete and rederive (DRed) method. Both are applied stratum by stratum.
+    '''
+    def __init__(self, rules, base_facts=()):
+        # Deleting a fact can add facts to a negation or change an aggregate,
+        # which delete and rederive does not account for
+        if not is_monotonic(rules):
+            raise Exception("The incremental maintenance does not support negation and aggregates.")
+        self.symbols = SymbolTable()
+        self.rules = [self.symbols.encode_rule(rule) for rule in rules]
+        self.strata = stratify(self.rules)
+        self.idb_predicates = dict.fromkeys(rule.head.predicate for rule in self.rules)
+        self.base_tuples = {predicate: set() for predicate in self.idb_predicates}
+        self.database = {}
+        for rule in self.rules:
+            for predicate in [rule.head] + rule.body:
+                self.relation(predicate.predicate)
+        self.compiler = RuleCompiler()
+        self.variants = {}
+        if base_facts:
+            self.insert(base_facts)
+
+    def relation(self, name):
+        if name not in self.database:
+            self.database[name] = IncrementalRelation()
+        return self.database[name]
+
+    def evaluate(self, rule, body, statistics, emit="add_new"):
+        # The typed values are extended in place for the constants interned
+        # by the updates since the rule was compiled
+        values = self.symbols.values()
+        self.compiler.get(rule.head, plan_body(body, statistics), emit, filters=rule.comparisons,
+                          values=values)(self.database)
+
+    def encode(self, fact):
+        return fact.fact.predicate, self.symbols.encode(fact.fact.terms)
+
+    def advance(self, stratum):
+        changed = False
+        for predicate in stratum.predicates:
+            relation = self.database[predicate]
+            changed = relation.advance() or changed
+            relation.added.update(relation.delta)
+        return changed
+
+    def propagate(self, stratum):
+        # Runs the semi-naive evaluation of a stratum from the tuples in the
+        # new parts of its relations
+        changed = self.advance(stratum)
+        if not stratum.recursive:
+            self.advance(stratum)
+            return
+
+        if id(stratum) not in self.variants:
+            self.variants[id(stratum)] = [(rule, body) for rule in stratum.rules
+                                          for body in delta_rules(rule, stratum.predicates)]
+        while changed:
+            statistics = collect_statistics(self.database, VERSIONS)
+            for rule, body in self.variants[id(stratum)]:
+                self.evaluate(rule, body, statistics)
+            changed = self.advance(stratum)
+
+    def changed_bodies(self, stratum, changed_version, other_version):
+        # For every body predicate from a lower stratum which changed in this
+        # batch, the body reading the change there and other_version of the
+        # other lower predicates
+        for rule in stratum.rules:
+            for i, predicate in enumerate(rule.body):
+                if predicate.predicate in stratum.predicates:
+                    continue
+                if not self.database[predicate.predicate].parts(changed_version)[0]:
+                    continue
+                body = []
+                for j, other in enumerate(rule.body):
+                    if j == i:
+                        body.append((other, changed_version))
+                    elif other.predicate in stratum.predicates:
+                        body.append((other, FULL))
+                    else:
+                        body.append((other, other_version))
+                yield rule, body
+
+    def insert(self, facts):
+        '''
+        Inserts a batch of facts and brings the fixpoint up to date.
+
+            Args:
+                facts (list): Facts which are to be inserted
+
+            Returns:
+                None
+        '''
+        for relation in self.database.values():
+            relation.reset()
+        for fact in facts:
+            name, terms = self.encode(fact)
+            relation = self.relation(name)
+            if name in self.idb_predicates:
+                # A base fact of an IDB predicate is a new tuple of its stratum
+                self.base_tuples[name].add(terms)
+                if terms not in relation.stable:
+                    relation.add_new(terms)
+            elif relation.stable.add(terms):
+                relation.added.add(terms)
+
+        for stratum in self.strata:
+            statistics = collect_statistics(self.database, VERSIONS)
+            for rule, body in self.changed_bodies(stratum, ADDED, FULL):
+                self.evaluate(rule, body, statistics)
+            self.propagate(stratum)
+
+    def delete(self, facts):
+        '''
+        Deletes a batch of facts and brings the fixpoint up to date. Tuples
+        which lose a derivation are over-deleted first, after which those
+        with an alternative derivation are rederived.
+
+            Args:
+                facts (list): Facts which are to be deleted
+
+            Returns:
+                None
+        '''
+        for relation in self.database.values():
+            relation.reset()
+        for fact in facts:
+            name, terms = self.encode(fact)
+            relation = self.relation(name)
+            if terms not in relation.stable:
+                continue
+            if name in self.idb_predicates:
+                # The tuple stays if it can be rederived from the rules
+                if terms in self.base_tuples[name]:
+                    self.base_tuples[name].discard(terms)
+                    relation.next_removing.add(terms)
+            else:
+                relation.stable.remove(terms)
+                relation.removed.add(terms)
+
+        for stratum in self.strata:
+            relations = [self.database[predicate] for predicate in stratum.predicates]
+
+            # Over-delete every tuple with a derivation using a deleted tuple,
+            # reading the lower strata as they were before the batch
+            statistics = collect_statistics(self.database, VERSIONS)
+            for rule, body in self.changed_bodies(stratum, REMOVED, BEFORE):
+                self.evaluate(rule, body, statistics, "mark_removed")
+            while any(relation.next_removing for relation in relations):
+                for relation in relations:
+                    relation.removing = relation.next_removing
+                    relation.next_removing = Relation()
+                    relation.removed.update(relation.removing)
+                statistics = collect_statistics(self.database, VERSIONS)
+                for rule in stratum.rules:
+                    for i, predicate in enumerate(rule.body):
+                        if predicate.predicate not in stratum.predicates:
+                            continue
+                        body = [(other, REMOVING if j == i else (FULL if other.predicate in stratum.predicates else BEFORE))
+                                for j, other in enumerate(rule.body)]
+                        self.evaluate(rule, body, statistics, "mark_removed")
+            for relation in relations:
+                relation.removing = Relation()
+                for fact in relation.removed:
+                    relation.stable.remove(fact)
+
+            # Rederive the over-deleted tuples which still have a derivation,
+            # binding the head of each rule to the over-deleted tuples
+            statistics = collect_statistics(self.database, VERSIONS)
+            for rule in stratum.rules:
+                body = [(rule.head, REMOVED)] + [(predicate, FULL) for predicate in rule.body]
+                self.evaluate(rule, body, statistics)
+            for predicate, relation in zip(stratum.predicates, relations):
+                for fact in relation.removed:
+                    if fact in self.base_tuples[predicate]:
+                        relation.add_new(fact)
+            self.propagate(stratum)
+
+            # Only the tuples which were not rederived are deleted for the
+            # strata above
+            for relation in relations:
+                relation.removed = Relation(fact for fact in relation.removed if fact not in relation.stable)
+
+    def derived(self):
+        '''
+        Returns the derived tuples which are not base facts.
+
+            Returns:
+                derived (dict): Maps each IDB predicate to its derived tuples
+        '''
+        return {predicate: self.database[predicate].stable.difference(self.base_tuples[predicate])
+                for predicate in self.idb_predicates}
+
+    def result(self):
+        return convert_to_datalog_format(self.derived(), self.symbols)
@@ -0,0 +1,176 @@
+from itertools import chain
+from ..model.model import Fact, Predicate, Rule
+from ..model.symbols import is_variable
+from .seminaive import semi_naive_fixpoint, convert_to_datalog_format
+from .filters import filter_variables
+from .stratification import is_monotonic
+from .snapshot import BASE, DERIVED
+
+
+def get_adornment(predicate, bound_variables):
+    # "b" for the arguments which are constants or bound variables, "f" for
+    # the free ones
+    return "".join("f" if is_variable(term) and term not in bound_variables else "b" for term in predicate.terms)
+
+
+def adorned_name(name, adornment):
+    return f"{name}_{adornment}"
+
+
+def magic_name(name, adornment):
+    return f"magic_{name}_{adornment}"
+
+
+def magic_predicate(predicate, adornment):
+    terms = [term for term, binding in zip(predicate.terms, adornment) if binding == "b"]
+    return Predicate(magic_name(predicate.predicate, adornment), terms, predicate.type)
+
+
+def magic_sets_rewrite(rules, query, base_predicates):
+    '''
+    Rewrites the rules with the magic-sets transformation for a query, using
+    left-to-right sideways information passing. Each IDB predicate reachable
+    from the query is adorned with the bound (b) and free (f) arguments it is
+    called with, and its rules are guarded by a magic predicate holding the
+    bindings which are actually requested, so that only facts relevant to the
+    bound arguments of the query are derived. Comparisons stay with their
+    rules and also filter the magic rules which bind all of their variables.
+
+        Args:
+            rules (list): Rules of the program
+            query (Query): Query which is to be answered
+            base_predicates (set): Names of the predicates with base facts
+
+        Returns:
+            rules (list): Rewritten rules
+            facts (list): Seed facts of the magic predicates
+            answer (str): Name of the predicate holding the query answers
+    '''
+    idb_predicates = {rule.head.predicate for rule in rules}
+    goal = query.query
+    query_adornment = get_adornment(goal, set())
+
+    rewritten = []
+    facts = []
+    if goal.predicate not in idb_predicates:
+        # The answers are base facts, which only have to be copied
+        variables = [f"X{i}" for i in range(len(goal.terms))]
+        answer = adorned_name(goal.predicate, "f" * len(goal.terms))
+        rewritten.append(Rule(Predicate(answer, variables, False), [Predicate(goal.predicate, variables, False)], 'rule'))
+        return rewritten, facts, answer
+
+    if "b" in query_adornment:
+        facts.append(Fact(magic_predicate(goal, query_adornment)))
+
+    worklist = [(goal.predicate, query_adornment)]
+    seen = set(worklist)
+    while worklist:
+        name, head_adornment = worklist.pop()
+        head_arity = None
+        for rule in rules:
+            if rule.head.predicate != name:
+                continue
+            head_arity = len(rule.head.terms)
+            bound_variables = {term for term, binding in zip(rule.head.terms, head_adornment)
+                               if binding == "b" and is_variable(term)}
+            guard = [magic_predicate(rule.head, head_adornment)] if "b" in head_adornment else []
+            body = []
+            for predicate in rule.body:
+                if predicate.predicate in idb_predicates:
+                    body_adornment = get_adornment(predicate, bound_variables)
+                    if "b" in body_adornment:
+                        # The bindings of a body predicate come from the
+                        # magic predicate of the head and the predicates
+                        # before it
+                        magic = magic_predicate(predicate, body_adornment)
+                        if guard or body:
+                            comparisons = [comparison for comparison in rule.comparisons
+                                           if filter_variables(comparison) <= bound_variables]
+                            rewritten.append(Rule(magic, guard + body, 'rule', comparisons))
+                        else:
+                            facts.append(Fact(magic))
+                    if (predicate.predicate, body_adornment) not in seen:
+                        seen.add((predicate.predicate, body_adornment))
+                        worklist.append((predicate.predicate, body_adornment))
+                    body.append(Predicate(adorned_name(predicate.predicate, body_adornment), predicate.terms, predicate.type))
+                else:
+                    body.append(predicate)
+                bound_variables.update(term for term in predicate.terms if is_variable(term))
+            head = Predicate(adorned_name(name, head_adornment), rule.head.terms, rule.head.type)
+            rewritten.append(Rule(head, guard + body, 'rule', rule.comparisons))
+
+        if name in base_predicates and head_arity is not None:
+            # The base facts of an IDB predicate are copied into its adorned
+            # version as far as they are requested
+            variables = [f"X{i}" for i in range(head_arity)]
+            head = Predicate(name, variables, False)
+            guard = [magic_predicate(head, head_adornment)] if "b" in head_adornment else []
+            rewritten.append(Rule(Predicate(adorned_name(name, head_adornment), variables, False), guard + [head], 'rule'))
+
+    return rewritten, facts, adorned_name(goal.predicate, query_adornment)
+
+
+def matches_query(fact, terms, symbols):
+    bindings = {}
+    for value, term in zip(fact, terms):
+        if not is_variable(term):
+            if symbols.ids.get(term) != value:
+                return False
+        elif bindings.setdefault(term, value) != value:
+            return False
+    return True
+
+
+def query_fixpoint(base_facts, rules, query, verbose=False, base_relations=None, snapshot=None, trace=None):
+    '''
+    Answers a query by evaluating the magic-sets rewriting of the program
+    with the semi-naive engine. The rewriting would evaluate the negated and
+    aggregated predicates only on the requested bindings, so a program with
+    negation or aggregates is evaluated in full and its answers are filtered.
+
+        Args:
+            base_facts (list): Facts of the program
+            rules (list): Rules of the program
+            query (Query): Query which is to be answered
+            verbose (Boolean): Prints the relations in every iteration
+            base_relations (dict): Maps predicates to iterables of tuples of
+                                   terms which are loaded as base facts
+            snapshot (Snapshot): Materialized database whose relations are
+                                 read as base facts
+            trace (Trace): Records the rule and iteration events of the
+                           evaluation of the rewritten rules
+
+        Returns:
+            answers (dict): Maps the query predicate to a generator of its
+                            tuples matching the query
+            symbols (SymbolTable): Symbol table of the interned terms
+    '''
+    base_predicates = {fact.fact.predicate for fact in base_facts} | set(base_relations or ())
+    goal = query.query
+    if snapshot and goal.predicate not in base_predicates and all(rule.head.predicate != goal.predicate for rule in rules):
+        # The answers only come from the snapshot, so they are read straight
+        # from its columns
+        tuples = chain(snapshot.tuples(goal.predicate, BASE), snapshot.tuples(goal.predicate, DERIVED))
+        symbols = snapshot.symbols
+        return {goal.predicate: (fact for fact in tuples if matches_query(fact, goal.terms, symbols))}, symbols
+    if snapshot:
+        base_predicates.update(snapshot.names())
+    if is_monotonic(rules):
+        rewritten, seeds, answer = magic_sets_rewrite(rules, query, base_predicates)
+    else:
+        # The base facts and the derived tuples of the goal are copied into
+        # the answer predicate
+        variables = [f"X{i}" for i in range(len(goal.terms))]
+        answer = adorned_name(goal.predicate, "f" * len(goal.terms))
+        rewritten = rules + [Rule(Predicate(answer, variables, False), [Predicate(goal.predicate, variables, False)], 'rule')]
+        seeds = []
+    derived, symbols = semi_naive_fixpoint(base_facts + seeds, rewritten, verbose, base_relations=base_relations,
+                                           snapshot=snapshot, trace=trace)
+
+    answers = (fact for fact in derived.get(answer, ()) if matches_query(fact, goal.terms, symbols))
+    return {goal.predicate: answers}, symbols
+
+
+def query_evaluation(base_facts, rules, query, verbose=False, base_relations=None):
+    answers, symbols = query_fixpoint(base_facts, rules, query, verbose, base_relations)
+    return convert_to_datalog_format(answers, symbols)
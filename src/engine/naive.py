@@ -1,104 +1,211 @@
-from ..model.model import Predicate
-
-
-def convert_to_datalog_format(database):
-    sorted_data = sorted(database, key=lambda x: x.predicate)
-    result = ""
-    for item in sorted_data:
-        predicate = item.predicate
-        terms = ", ".join(item.terms)
-        result += f"{predicate}({terms}).\n"
-    return result
-
-
-def naive_evaluation(base_facts, rules, verbose=False):
-    database = set(fact.fact for fact in base_facts)
-    new_facts = database.copy()  # Initialize new_facts with base facts
+from ..model.symbols import SymbolTable, is_variable
+from .relation import Relation
+from .planner import Statistics, plan_body
+from .filters import place_filters, comparison_test
+from .trace import RuleCounters, format_rule
+from .stratification import is_monotonic
+from ..utilities.writer import format_facts
+import time
+
+
+# Number of partial matches which the join steps pass on at a time
+DEFAULT_BATCH_SIZE = 1024
+
+
+def convert_to_datalog_format(database, symbols):
+    # The relations are written in alphabetical order of the predicates
+    return "".join(f"{fact}\n" for fact in format_facts({name: database[name] for name in sorted(database)}, symbols))
+
+
+def naive_fixpoint(base_facts, rules, verbose=False, base_relations=None, trace=None, batch_size=DEFAULT_BATCH_SIZE):
+    '''
+    Computes the fixpoint of a program with the naive evaluation. Every
+    iteration evaluates all rules on the whole database, until no rule
+    derives a new fact. The facts are stored per predicate, and each body
+    predicate is looked up through an index on its constants and on the
+    variables bound by the predicates before it.
+
+        Args:
+            base_facts (list): Facts of the program
+            rules (list): Rules of the program
+            verbose (Boolean): Prints the relations in every iteration
+            base_relations (dict): Maps predicates to iterables of tuples of
+                                   terms which are loaded as base facts
+            trace (Trace): Records the rule and iteration events of the
+                           evaluation
+            batch_size (int): Number of partial matches passed between the
+                              join steps at a time, or None to materialize
+                              the matches of every body predicate
+
+        Returns:
+            derived (dict): Maps each predicate to the terms of its derived
+                            facts which are not base facts
+            symbols (SymbolTable): Symbol table of the interned terms
+    '''
+    if not is_monotonic(rules):
+        raise Exception("The naive evaluation method does not support negation and aggregates.")
+
+    # Constants are interned at load time, so the facts hold integer terms
+    symbols = SymbolTable()
+    database = {}
+    for fact in base_facts:
+        database.setdefault(fact.fact.predicate, Relation()).add(symbols.encode(fact.fact.terms))
+    for name, rows in (base_relations or {}).items():
+        relation = database.setdefault(name, Relation())
+        for terms in rows:
+            relation.add(symbols.encode(terms))
+    rules = [symbols.encode_rule(rule) for rule in rules]
+    for rule in rules:
+        for predicate in [rule.head] + rule.body:
+            database.setdefault(predicate.predicate, Relation())
+
+    # The comparisons compare the typed values of the interned constants
+    values = symbols.values()
+
+    # Only the predicates in rule heads get new facts
+    idb_predicates = sorted(set(rule.head.predicate for rule in rules))
+    base_database = {name: set(database[name].tuples) for name in idb_predicates}
 
     i = 1
-    while new_facts:  # Continue as long as there are new facts
+    changed = True
+    while changed:  # Continue as long as there are new facts
         if verbose:
             print(f"<---------- Iteration {i} ---------->")
 
-        next_new_facts = set()  # To keep track of the facts derived in the next iteration
-        all_derived_facts = set()
+        # To keep track of the facts derived in the next iteration
+        next_new_facts = {name: set() for name in idb_predicates}
         if verbose:
                 print(f"Input: ")
-                database_formatted = convert_to_datalog_format(database)
+                database_formatted = convert_to_datalog_format(database, symbols)
                 print(database_formatted)
 
+        start = time.perf_counter()
+        statistics = Statistics({(name, None): len(relation) for name, relation in database.items()})
         for rule in rules:
-            for match in match_and_join(rule, database):  # Use the entire database to derive new facts
+            body = [predicate for predicate, _ in plan_body([(predicate, None) for predicate in rule.body], statistics)]
+            counters = RuleCounters(len(body)) if trace is not None and trace.rules else None
+            rule_start = time.perf_counter()
+            head_relation = database[rule.head.predicate]
+            new_facts = next_new_facts[rule.head.predicate]
+            size = len(new_facts)
+            for match in match_and_join(rule, database, body, counters, batch_size, values):  # Use the entire database to derive new facts
                 derived_fact = project_head(rule, match)
-                if verbose:
-                    all_derived_facts.add(derived_fact)
-                if derived_fact not in database:
-                    next_new_facts.add(derived_fact)
-        
-        # if verbose:
-        #         print(f"New IDB: ")
-        #         all_derived_facts_formatted = convert_to_datalog_format(all_derived_facts)
-        #         print(all_derived_facts_formatted)
-        
-        database.update(next_new_facts)
+                if derived_fact not in head_relation:
+                    new_facts.add(derived_fact)
+            if counters is not None:
+                trace.rule(0, i, format_rule(rule.head, [(predicate, None) for predicate in rule.body], symbols,
+                                             rule.comparisons),
+                           [predicate.predicate for predicate in body], counters, time.perf_counter() - rule_start,
+                           len(new_facts) - size)
+
+        for name, new_facts in next_new_facts.items():
+            database[name].update(new_facts)
+        if trace is not None:
+            trace.iteration(0, i, time.perf_counter() - start,
+                            {name: len(new_facts) for name, new_facts in next_new_facts.items()})
         if verbose:
                 print(f"New IDB: ")
-                database_formatted = convert_to_datalog_format(database)
+                database_formatted = convert_to_datalog_format(database, symbols)
                 print(database_formatted)
-        new_facts = next_new_facts  # Update new_facts for the next iteration
+        changed = any(next_new_facts.values())
         i += 1
 
+    derived = {name: database[name].difference(base_database[name]) for name in idb_predicates}
+    return derived, symbols
 
-    to_remove_converted = {item.fact for item in base_facts}
-    idb_database = database - to_remove_converted
 
-    return convert_to_datalog_format(idb_database)
+def naive_evaluation(base_facts, rules, verbose=False, base_relations=None, batch_size=DEFAULT_BATCH_SIZE):
+    derived, symbols = naive_fixpoint(base_facts, rules, verbose, base_relations, batch_size=batch_size)
+    return "".join(f"{fact}\n" for fact in format_facts(derived, symbols))
 
 
-def match_and_join(rule, database):
-    # Initialize the list of matches with a single empty match
-    matches = [{}]
+def join_step(batches, k, predicate, relation, columns, key_terms, tests, batch_size, counters):
+    # Initialize a new batch of matches for the current predicate
+    new_matches = []
 
-    # Iterate over the predicates in the rule's body
-    for predicate in rule.body:
-        # Find the facts in the database that match the current predicate
-        matching_facts = [fact for fact in database if fact_matches_predicate(fact, predicate)]
-
-        # Initialize a new list of matches for the current predicate
-        new_matches = []
-
-        # Iterate over the current matches and the matching facts
-        for match in matches:
-            for fact in matching_facts:
+    # Iterate over the batches of matches of the previous predicate, the
+    # matches in each batch and the candidate facts
+    for batch in batches:
+        for match in batch:
+            key = tuple(match[term] if is_variable(term) else term for term in key_terms)
+            candidates = relation.lookup(columns, key)
+            if counters is not None:
+                counters.scanned[k] += len(candidates)
+            for fact in candidates:
                 # Join the current match with the current fact
                 joined_match = join_match_with_fact(match, fact, predicate)
-                if joined_match is not None:
-                    new_matches.append(joined_match)
-
-        # Update the matches with the new matches for the current predicate
-        matches = new_matches
-
-    return matches
-
-
-def fact_matches_predicate(fact, predicate):
-    # Check if the predicate names match
-    if fact.predicate != predicate.predicate:
-        return False
-
-    # Check if the terms match, allowing for variables in the predicate
-    for fact_term, predicate_term in zip(fact.terms, predicate.terms):
-        # If the predicate term is a variable (uppercase), it can match any
-        # fact term
-        if predicate_term[0].isupper():
-            continue
-
-        # If the predicate term is a constant (lowercase), it must match the
-        # corresponding fact term
-        if fact_term != predicate_term:
-            return False
-
-    return True
+                if joined_match is None:
+                    continue
+
+                # Apply the comparisons whose variables are all bound now
+                if tests and not all(test(joined_match) for test in tests):
+                    continue
+                new_matches.append(joined_match)
+
+                # Pass a full batch on to the next predicate before looking
+                # for more matches
+                if batch_size is not None and len(new_matches) >= batch_size:
+                    if counters is not None:
+                        counters.matches[k] += len(new_matches)
+                    yield new_matches
+                    new_matches = []
+
+    # Pass on the last, partial batch
+    if new_matches:
+        if counters is not None:
+            counters.matches[k] += len(new_matches)
+        yield new_matches
+
+
+def match_and_join(rule, database, body=None, counters=None, batch_size=DEFAULT_BATCH_SIZE, values=None):
+    '''
+    Joins the body predicates of a rule as a pipeline of generators, one per
+    body predicate. Every step reads the matches of the step before it in
+    batches and passes its own matches on as soon as a batch is full, so
+    at most one batch per predicate is held in memory. The comparisons of
+    the rule filter the matches of the first step at which all of their
+    variables are bound.
+
+        Args:
+            rule (Rule): Rule whose body is joined
+            database (dict): Maps predicates to their Relation
+            body (list): Body predicates in the planned join order, or None
+                         for the order of the rule
+            counters (RuleCounters): Counters of the evaluation, if it is
+                                     traced
+            batch_size (int): Number of matches passed on at a time, or None
+                              to pass on all matches of a predicate at once
+            values (list): Typed values of the interned constants, which
+                           the comparisons compare
+
+        Returns:
+            matches (generator): Matches of the whole body
+    '''
+    # Start with a single batch holding the empty match
+    batches = iter([[{}]])
+    bound_variables = set()
+    body = rule.body if body is None else body
+    placed = place_filters([predicate.terms for predicate in body], rule.comparisons)
+
+    # Chain a join step for every predicate in the rule's body, in the
+    # planned order if one is given
+    for k, predicate in enumerate(body):
+        # The constants and the variables bound by the previous predicates
+        # select the candidate facts through an index of the relation
+        columns = []
+        key_terms = []
+        for column, term in enumerate(predicate.terms):
+            if not is_variable(term) or term in bound_variables:
+                columns.append(column)
+                key_terms.append(term)
+        tests = [comparison_test(comparison, values) for comparison in placed[k]]
+        batches = join_step(batches, k, predicate, database[predicate.predicate], tuple(columns), key_terms,
+                            tests, batch_size, counters)
+        bound_variables.update(term for term in predicate.terms if is_variable(term))
+
+    # Matches are produced as the batches flow through the steps
+    for batch in batches:
+        yield from batch
 
 
 def join_match_with_fact(match, fact, predicate):
@@ -107,9 +214,9 @@ def join_match_with_fact(match, fact, predicate):
 
     # Iterate over the terms of the fact and the corresponding terms of the
     # predicate
-    for fact_term, predicate_term in zip(fact.terms, predicate.terms):
+    for fact_term, predicate_term in zip(fact, predicate.terms):
         # If the predicate term is a variable (uppercase)
-        if predicate_term[0].isupper():
+        if is_variable(predicate_term):
             # If the variable is already bound in the match, check if the
             # binding is consistent with the fact term
             if predicate_term in joined_match and joined_match[predicate_term] != fact_term:
@@ -132,13 +239,4 @@ def project_head(rule, match):
 
     # Construct the derived fact's terms by replacing variables with their
     # bindings in the match
-    derived_terms = [match[term] if term[0].isupper() else term for term in head.terms]
-
-    # Construct the derived fact as a Predicate object
-    derived_fact_predicate = Predicate(
-        name=head.predicate,
-        terms=derived_terms,
-        type='predicate'
-    )
-
-    return derived_fact_predicate
+    return tuple(match[term] if is_variable(term) else term for term in head.terms)
@@ -0,0 +1,391 @@
+from array import array
+from multiprocessing import Pipe, Process, Queue
+from multiprocessing.shared_memory import SharedMemory
+from .relation import VersionedRelation, DELTA, FULL
+from .planner import plan_body
+from .compiler import RuleCompiler
+from .stratification import stratify, is_monotonic
+from .seminaive import collect_statistics, convert_to_datalog_format, delta_rules
+from ..model.model import Predicate
+from ..model.symbols import SymbolTable, is_variable
+
+
+# Columns of a storage which holds a replica of its relation on every worker
+# instead of a partition
+REPLICA = None
+
+# Requests of the coordinator to the workers
+INITIAL = "initial"     # Evaluate the rules of the stratum on the full relations
+ITERATE = "iterate"     # Evaluate the delta variants of the rules of the stratum
+FINISH = "finish"       # Merge the last delta of the stratum into the stable parts
+COLLECT = "collect"     # Send the owned tuples of the IDB relations
+
+
+def owner(key, workers):
+    # Integers and tuples of integers hash the same in every process
+    return hash(key) % workers
+
+
+def partition_key(fact, columns):
+    return fact[columns[0]] if len(columns) == 1 else tuple(fact[column] for column in columns)
+
+
+def split(facts, columns, workers):
+    # Divides tuples among the workers owning them in a partition
+    shares = [[] for _ in range(workers)]
+    if len(columns) == 1:
+        column = columns[0]
+        for fact in facts:
+            shares[hash(fact[column]) % workers].append(fact)
+    else:
+        for fact in facts:
+            shares[owner(partition_key(fact, columns), workers)].append(fact)
+    return shares
+
+
+def storage_name(name, columns):
+    # Every storage of a relation is a predicate of its own in the database
+    # of a worker, so that two atoms of a body can read different storages
+    return f"{name}[{'*' if columns is REPLICA else ','.join(map(str, columns))}]"
+
+
+def partition_variable(body, idb_predicates):
+    '''
+    Chooses the variable on whose hash the instances of a rule (or of a delta
+    variant) are divided among the workers: an instance is evaluated by the
+    worker owning the value of the variable. The variable is taken from the
+    delta predicate, so that every worker only scans its share of the delta,
+    and it occurs in as many IDB predicates and then in as many predicates
+    of the body as possible, since the predicates without it are read from
+    replicas.
+
+        Args:
+            body (list): List of (predicate, version) pairs
+            idb_predicates (dict): Names of the IDB predicates
+
+        Returns:
+            variable (str): Partition variable, or None if the driving
+                            predicates have no variable
+    '''
+    drivers = [predicate for predicate, version in body if version == DELTA] or [predicate for predicate, _ in body]
+    candidates = dict.fromkeys(term for predicate in drivers for term in predicate.terms if is_variable(term))
+
+    def score(variable):
+        atoms = [predicate for predicate, _ in body if variable in predicate.terms]
+        return sum(1 for predicate in atoms if predicate.predicate in idb_predicates), len(atoms)
+
+    return max(candidates, key=score) if candidates else None
+
+
+def atom_columns(predicate, variable):
+    # An atom holding the partition variable reads the partition of its
+    # relation on the first column of the variable, any other atom a replica
+    if variable is not None and variable in predicate.terms:
+        return (predicate.terms.index(variable),)
+    return REPLICA
+
+
+class PartitionLayout(object):
+    '''
+    Decides where the tuples of every relation are stored, the same way in
+    the coordinator and in every worker. A relation has a storage for every
+    way a body atom reads it: a hash partition on a column, of which every
+    worker owns the tuples whose value in the column hashes to its number,
+    or a replica. The first partition of an IDB relation is its home, from
+    which its tuples are counted and collected.
+    '''
+    def __init__(self, rules, workers):
+        self.workers = workers
+        self.idb_predicates = dict.fromkeys(rule.head.predicate for rule in rules)
+        self.strata = stratify(rules)
+        self.variants = []
+        self.storages = {}
+        for stratum in self.strata:
+            initial = [self.variant(rule, [(predicate, FULL) for predicate in rule.body]) for rule in stratum.rules]
+            recursive = [self.variant(rule, body) for rule in stratum.rules
+                         for body in delta_rules(rule, stratum.predicates)] if stratum.recursive else []
+            self.variants.append((initial, recursive))
+        self.homes = {}
+        for rule in rules:
+            name = rule.head.predicate
+            columns = self.storages.setdefault(name, [])
+            if not columns:
+                # A relation which no body reads is partitioned on all columns
+                columns.append(tuple(range(len(rule.head.terms))))
+            self.homes[name] = next((column for column in columns if column is not REPLICA), REPLICA)
+
+    def variant(self, rule, body):
+        variable = partition_variable(body, self.idb_predicates)
+        stored_body = []
+        for predicate, version in body:
+            columns = atom_columns(predicate, variable)
+            storages = self.storages.setdefault(predicate.predicate, [])
+            if columns not in storages:
+                storages.append(columns)
+            stored_body.append((Predicate(storage_name(predicate.predicate, columns), predicate.terms, predicate.type),
+                                version))
+        # Without a partition variable, a single worker evaluates the rule
+        evaluator = None if variable is not None else owner((), self.workers)
+        return rule, stored_body, evaluator
+
+    def owns(self, worker, columns, fact):
+        return columns is REPLICA or owner(partition_key(fact, columns), self.workers) == worker
+
+
+class Outbox(object):
+    # Stands in for the head relation of the rules and collects the derived
+    # tuples until they are sent to the workers storing them
+    def __init__(self):
+        self.tuples = set()
+        self.add_new = self.tuples.add
+
+
+def read_shared_relation(name, count, arity):
+    # The tuples are read from shared memory one at a time, so that a worker
+    # only keeps the tuples of its partitions
+    memory = SharedMemory(name=name)
+    values = memory.buf.cast('q')
+    try:
+        for i in range(0, count * arity, arity):
+            yield tuple(values[i:i + arity])
+    finally:
+        values.release()
+        memory.close()
+
+
+def run_worker(connection, worker, inboxes, rules, shared_relations, values):
+    '''
+    Main loop of a worker process. The worker stores its partition of every
+    relation which the rules read on a partition column, and a replica of
+    the others. It evaluates the rule instances whose partition variable it
+    owns and sends every derived tuple straight to the workers storing it,
+    which add it to their storages unless they already hold it, so the
+    tuples are deduplicated by their owners in parallel and no worker
+    installs the tuples of the partitions of the others. The tuples are sent
+    per storage, so that the receiver adds them without hashing them again.
+    The comparisons of the rules compare the typed values sent by the
+    coordinator.
+    '''
+    workers = len(inboxes)
+    layout = PartitionLayout(rules, workers)
+    database = {}
+    local_storages = {}
+    for name, storages in layout.storages.items():
+        local_storages[name] = [(columns, database.setdefault(storage_name(name, columns), VersionedRelation()))
+                                for columns in storages]
+    for name, shared in shared_relations.items():
+        storages = local_storages.get(name)
+        if not storages:
+            continue
+        for fact in read_shared_relation(*shared):
+            for columns, relation in storages:
+                if layout.owns(worker, columns, fact):
+                    relation.stable.add(fact)
+    outboxes = {name: Outbox() for name in layout.idb_predicates}
+    tables = dict(database)
+    tables.update(outboxes)
+    compiler = RuleCompiler()
+
+    def install(message):
+        for storage, facts in message.items():
+            add_new = database[storage].add_new
+            for fact in facts:
+                add_new(fact)
+
+    def exchange():
+        outgoing = [{} for _ in range(workers)]
+        for name, outbox in outboxes.items():
+            if not outbox.tuples:
+                continue
+            for columns in layout.storages[name]:
+                storage = storage_name(name, columns)
+                if columns is REPLICA or workers == 1:
+                    facts = list(outbox.tuples)
+                    for message in outgoing:
+                        message[storage] = facts
+                    continue
+                for message, share in zip(outgoing, split(outbox.tuples, columns, workers)):
+                    if share:
+                        message[storage] = share
+            outbox.tuples.clear()
+        for destination, message in enumerate(outgoing):
+            if destination != worker:
+                inboxes[destination].put(message)
+        install(outgoing[worker])
+        for _ in range(workers - 1):
+            install(inboxes[worker].get())
+
+    def advance(predicates):
+        for name in predicates:
+            for _, relation in local_storages[name]:
+                relation.advance()
+
+    def delta_sizes(predicates):
+        # Every tuple of the delta is counted by the owner of its home
+        sizes = {}
+        for name in predicates:
+            home = layout.homes[name]
+            counted = home is not REPLICA or worker == 0
+            sizes[name] = len(database[storage_name(name, home)].delta) if counted else 0
+        return sizes
+
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        request, stratum_index = message
+        exchanged = False
+        try:
+            if request == COLLECT:
+                reply = {}
+                for name, home in layout.homes.items():
+                    if home is not REPLICA or worker == 0:
+                        reply[name] = list(database[storage_name(name, home)].stable)
+                connection.send(reply)
+                continue
+            stratum = layout.strata[stratum_index]
+            if request == FINISH:
+                advance(stratum.predicates)
+                continue
+
+            initial, recursive = layout.variants[stratum_index]
+            statistics = collect_statistics(database)
+            for rule, body, evaluator in initial if request == INITIAL else recursive:
+                if evaluator is None or evaluator == worker:
+                    compiler.get(rule.head, plan_body(body, statistics), filters=rule.comparisons,
+                                 values=values)(tables)
+            exchange()
+            exchanged = True
+            advance(stratum.predicates)
+            connection.send(delta_sizes(stratum.predicates))
+        except Exception as e:
+            if request in (INITIAL, ITERATE) and not exchanged:
+                # The other workers still wait for the tuples of this worker
+                for destination in range(workers):
+                    if destination != worker:
+                        inboxes[destination].put({})
+                for _ in range(workers - 1):
+                    inboxes[worker].get()
+            connection.send(e)
+
+    connection.close()
+
+
+def share_relation(tuples):
+    values = array('q', (value for fact in tuples for value in fact))
+    memory = SharedMemory(create=True, size=max(len(values) * values.itemsize, 1))
+    memory.buf[:len(values) * values.itemsize] = values.tobytes()
+    return memory
+
+
+def parallel_semi_naive_fixpoint(base_facts, rules, verbose=False, workers=2, base_relations=None):
+    '''
+    Semi-naive evaluation on several worker processes. Every relation is
+    hash partitioned among the workers on the columns its body atoms join
+    on, and the strata are evaluated in order. In every iteration of a
+    stratum, each worker evaluates the delta variants of the rules on its
+    partitions and sends the derived tuples to the workers owning them,
+    which deduplicate them into the next delta; the coordinator only
+    synchronizes the iterations.
+
+        Args:
+            base_facts (list): Facts of the program
+            rules (list): Rules of the program
+            verbose (Boolean): Prints the delta sizes in every iteration
+            workers (int): Number of worker processes
+            base_relations (dict): Maps predicates to iterables of tuples of
+                                   terms which are loaded as base facts
+
+        Returns:
+            derived (dict): Maps each IDB predicate to its derived tuples
+                            which are not base facts
+            symbols (SymbolTable): Symbol table of the interned terms
+    '''
+    if not is_monotonic(rules):
+        raise Exception("The parallel evaluation method does not support negation and aggregates.")
+
+    symbols = SymbolTable()
+    base_tuples = {}
+    arities = {}
+    for fact in base_facts:
+        base_tuples.setdefault(fact.fact.predicate, set()).add(symbols.encode(fact.fact.terms))
+        arities[fact.fact.predicate] = len(fact.fact.terms)
+    for name, rows in (base_relations or {}).items():
+        tuples = base_tuples.setdefault(name, set())
+        for terms in rows:
+            arities[name] = len(terms)
+            tuples.add(symbols.encode(terms))
+    rules = [symbols.encode_rule(rule) for rule in rules]
+    layout = PartitionLayout(rules, workers)
+    # The typed values of the constants are only sent if a rule compares them
+    values = symbols.values() if any(rule.comparisons for rule in rules) else []
+
+    # The base facts are placed in shared memory once instead of being sent
+    # to the workers, which keep the tuples of their partitions
+    memories = {name: share_relation(tuples) for name, tuples in base_tuples.items() if tuples}
+    shared_relations = {name: (memory.name, len(base_tuples[name]), arities[name]) for name, memory in memories.items()}
+
+    connections = []
+    processes = []
+    inboxes = [Queue() for _ in range(workers)]
+    try:
+        for worker in range(workers):
+            connection, worker_connection = Pipe()
+            process = Process(target=run_worker, daemon=True,
+                              args=(worker_connection, worker, inboxes, rules, shared_relations, values))
+            process.start()
+            connections.append(connection)
+            processes.append(process)
+
+        def request(request, stratum_index=None):
+            for connection in connections:
+                connection.send((request, stratum_index))
+            replies = [connection.recv() for connection in connections]
+            for reply in replies:
+                if isinstance(reply, Exception):
+                    raise reply
+            return replies
+
+        def delta_sizes(replies):
+            sizes = {}
+            for reply in replies:
+                for name, size in reply.items():
+                    sizes[name] = sizes.get(name, 0) + size
+            return sizes
+
+        i = 1
+        for stratum_index, stratum in enumerate(layout.strata):
+            sizes = delta_sizes(request(INITIAL, stratum_index))
+            while stratum.recursive and any(sizes.values()):
+                sizes = delta_sizes(request(ITERATE, stratum_index))
+                if verbose:
+                    print(f"<---------- Iteration {i} ---------->")
+                    for name, size in sizes.items():
+                        print(f"delta({name}): {size} tuples")
+                i += 1
+            for connection in connections:
+                connection.send((FINISH, stratum_index))
+
+        derived = {name: set() for name in layout.idb_predicates}
+        for reply in request(COLLECT):
+            for name, tuples in reply.items():
+                derived[name].update(tuples)
+    finally:
+        for connection in connections:
+            connection.send(None)
+        for process in processes:
+            # A worker left waiting for the tuples of a failed worker is
+            # stopped
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for memory in memories.values():
+            memory.close()
+            memory.unlink()
+
+    return {name: tuples - base_tuples.get(name, set()) for name, tuples in derived.items()}, symbols
+
+
+def parallel_semi_naive_evaluation(base_facts, rules, verbose=False, workers=2, base_relations=None):
+    derived, symbols = parallel_semi_naive_fixpoint(base_facts, rules, verbose, workers, base_relations)
+    return convert_to_datalog_format(derived, symbols)
@@ -0,0 +1,72 @@
+from ..model.symbols import is_variable
+
+
+class Statistics(object):
+    '''
+    Cardinalities of the relations read by the rule bodies, together with the
+    number of distinct keys of the indexes built so far. The engines refresh
+    them between iterations.
+    '''
+    def __init__(self, cardinalities=None, distinct_counts=None):
+        self.cardinalities = cardinalities if cardinalities is not None else {}
+        self.distinct_counts = distinct_counts if distinct_counts is not None else {}
+
+    def cardinality(self, name, version=None):
+        return self.cardinalities.get((name, version), 0)
+
+    def distinct(self, name, version, columns):
+        return self.distinct_counts.get((name, version, columns))
+
+
+def estimate_matches(predicate, version, bound_variables, statistics):
+    '''
+    Estimates the number of tuples of a body predicate which match a single
+    binding of the variables bound so far.
+
+        Args:
+            predicate (Predicate): Body predicate
+            version (str): Version of the relation which is read
+            bound_variables (set): Variables bound by the predicates before it
+            statistics (Statistics): Current relation statistics
+
+        Returns:
+            estimate (float): Estimated number of matching tuples
+    '''
+    cardinality = statistics.cardinality(predicate.predicate, version)
+    columns = tuple(column for column, term in enumerate(predicate.terms)
+                    if not is_variable(term) or term in bound_variables)
+    if not columns or cardinality == 0:
+        return cardinality
+    if len(columns) == len(predicate.terms):
+        return 1
+    distinct = statistics.distinct(predicate.predicate, version, columns)
+    if distinct:
+        return cardinality / distinct
+    # Without an index on the columns, assume that the values are spread
+    # evenly over the columns of the relation
+    return cardinality ** (1 - len(columns) / len(predicate.terms))
+
+
+def plan_body(body, statistics):
+    '''
+    Orders the predicates of a rule body greedily, so that each step joins
+    the predicate producing the fewest estimated partial matches given the
+    variables bound by the steps before it. Ties keep the source order.
+
+        Args:
+            body (list): List of (predicate, version) pairs
+            statistics (Statistics): Current relation statistics
+
+        Returns:
+            body (list): The same pairs in join order
+    '''
+    remaining = list(body)
+    ordered = []
+    bound_variables = set()
+    while remaining:
+        best = min(range(len(remaining)),
+                   key=lambda i: estimate_matches(remaining[i][0], remaining[i][1], bound_variables, statistics))
+        predicate, version = remaining.pop(best)
+        ordered.append((predicate, version))
+        bound_variables.update(term for term in predicate.terms if is_variable(term))
+    return ordered
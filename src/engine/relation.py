@@ -0,0 +1,229 @@
+def insert_path(trie, fact, columns):
+    node = trie
+    for column in columns[:-1]:
+        child = node.get(fact[column])
+        if child is None:
+            child = node[fact[column]] = {}
+        node = child
+    node[fact[columns[-1]]] = None
+
+
+def remove_path(trie, fact, columns):
+    # Removes the leaf of a tuple and every level which it leaves empty
+    nodes = [trie]
+    for column in columns[:-1]:
+        nodes.append(nodes[-1][fact[column]])
+    for node, column in zip(reversed(nodes), reversed(columns)):
+        del node[fact[column]]
+        if node:
+            break
+
+
+class Relation(object):
+    '''
+    A set of tuples which keeps hash indexes on demand for each set of bound
+    columns, and tries for each order of the columns. An index or a trie is
+    built the first time it is requested and is kept up to date by every
+    later insertion.
+    '''
+    def __init__(self, tuples=()):
+        self.tuples = set()
+        self.indexes = {}
+        self.tries = {}
+        self.update(tuples)
+
+    def add(self, fact):
+        '''
+        Inserts a tuple into the relation and all of its indexes.
+
+            Args:
+                fact (tuple): Tuple which is to be inserted
+
+            Returns:
+                added (Boolean): False if the tuple was already present
+        '''
+        if fact in self.tuples:
+            return False
+        self.tuples.add(fact)
+        for columns, index in self.indexes.items():
+            key = tuple(fact[column] for column in columns)
+            bucket = index.get(key)
+            if bucket is None:
+                index[key] = [fact]
+            else:
+                bucket.append(fact)
+        for columns, trie in self.tries.items():
+            insert_path(trie, fact, columns)
+        return True
+
+    def update(self, facts):
+        if not self.indexes and not self.tries:
+            # Without indexes to maintain, the tuples are inserted in bulk
+            self.tuples.update(facts)
+            return
+        for fact in facts:
+            self.add(fact)
+
+    def remove(self, fact):
+        '''
+        Removes a tuple from the relation and all of its indexes.
+
+            Args:
+                fact (tuple): Tuple which is to be removed
+
+            Returns:
+                removed (Boolean): False if the tuple was not present
+        '''
+        if fact not in self.tuples:
+            return False
+        self.tuples.remove(fact)
+        for columns, index in self.indexes.items():
+            key = tuple(fact[column] for column in columns)
+            bucket = index[key]
+            bucket.remove(fact)
+            if not bucket:
+                del index[key]
+        for columns, trie in self.tries.items():
+            remove_path(trie, fact, columns)
+        return True
+
+    def index(self, columns):
+        '''
+        Returns the hash index on the given columns, building it if needed.
+
+            Args:
+                columns (tuple): Positions of the bound columns
+
+            Returns:
+                index (dict): Maps the values of the bound columns to the list
+                              of tuples which have those values
+        '''
+        index = self.indexes.get(columns)
+        if index is None:
+            index = {}
+            for fact in self.tuples:
+                key = tuple(fact[column] for column in columns)
+                bucket = index.get(key)
+                if bucket is None:
+                    index[key] = [fact]
+                else:
+                    bucket.append(fact)
+            self.indexes[columns] = index
+        return index
+
+    def trie(self, columns):
+        '''
+        Returns the trie of the relation in the given order of the columns,
+        building it if needed.
+
+            Args:
+                columns (tuple): Positions of all columns in the order of the
+                                 levels of the trie
+
+            Returns:
+                trie (dict): Maps the values of the first column to the tries
+                             of the remaining columns; the last level maps
+                             the values of the last column to None
+        '''
+        trie = self.tries.get(columns)
+        if trie is None:
+            trie = {}
+            for fact in self.tuples:
+                insert_path(trie, fact, columns)
+            self.tries[columns] = trie
+        return trie
+
+    def lookup(self, columns, key):
+        '''
+        Returns the tuples whose bound columns are equal to the key.
+
+            Args:
+                columns (tuple): Positions of the bound columns
+                key (tuple): Values of the bound columns
+
+            Returns:
+                tuples (iterable): Matching tuples
+        '''
+        if not columns:
+            return self.tuples
+        return self.index(columns).get(key, ())
+
+    def difference(self, other):
+        return Relation(fact for fact in self.tuples if fact not in other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    def __contains__(self, fact):
+        return fact in self.tuples
+
+    def __iter__(self):
+        return iter(self.tuples)
+
+    def __len__(self):
+        return len(self.tuples)
+
+    def __repr__(self):
+        return "%r" % (self.tuples)
+
+
+# Versions of a relation which a body predicate can read from
+OLD = "old"        # Tuples known before the previous iteration
+DELTA = "delta"    # Tuples derived for the first time in the previous iteration
+FULL = "full"      # Union of the old and the delta tuples
+
+
+class VersionedRelation(object):
+    '''
+    A relation split into a stable, a delta and a new part, which are
+    updated in place between the iterations of the semi-naive evaluation.
+    '''
+    def __init__(self, tuples=()):
+        self.stable = Relation(tuples)
+        self.delta = Relation()
+        self.new = Relation()
+
+    def parts(self, version):
+        '''
+        Returns the relations which make up a version of this relation.
+
+            Args:
+                version (str): One of OLD, DELTA or FULL
+
+            Returns:
+                parts (tuple): Disjoint relations whose union is the version
+        '''
+        if version == OLD:
+            return (self.stable,)
+        if version == DELTA:
+            return (self.delta,)
+        return (self.stable, self.delta)
+
+    def add_new(self, fact):
+        # A tuple is new only if it is neither stable nor in the current delta
+        if fact in self.stable or fact in self.delta:
+            return False
+        return self.new.add(fact)
+
+    def advance(self):
+        '''
+        Merges the delta into the stable part and makes the new tuples the
+        next delta.
+
+            Returns:
+                changed (Boolean): True if the next delta is not empty
+        '''
+        self.stable.update(self.delta)
+        self.delta = self.new
+        self.new = Relation()
+        return len(self.delta) > 0
+
+    def __contains__(self, fact):
+        return fact in self.stable or fact in self.delta
+
+    def __iter__(self):
+        yield from self.stable
+        yield from self.delta
+
+    def __len__(self):
+        return len(self.stable) + len(self.delta)
@@ -1,27 +1,29 @@
-from ..model.model import Predicate
-from collections import defaultdict
-import copy
+import time
+from .relation import VersionedRelation, OLD, DELTA, FULL
+from .planner import Statistics, plan_body
+from .compiler import RuleCompiler
+from .stratification import stratify
+from .closure import recognize_closure, evaluate_closure
+from .aggregate import has_aggregates, GroupAggregator
+from .triejoin import is_cyclic, variable_order, trie_join
+from .filters import rule_filters, place_filters, filter_test
+from .snapshot import BASE, DERIVED, save_snapshot
+from .trace import RuleCounters, format_rule
+from ..model.symbols import SymbolTable, is_variable
+from ..utilities.writer import format_facts
 
-def convert_to_datalog_format(data):
-    result = []
-    for predicate, facts in data.items():
-        for fact in facts:
-            terms = ", ".join(fact)
-            result.append(f"{predicate}({terms}).")
-    return "\n".join(result)
 
+def convert_to_datalog_format(data, symbols):
+    return "\n".join(format_facts(data, symbols))
 
-def get_facts_matching_predicate(predicate, database):
+
+def get_facts_matching_predicate(predicate, database, version=FULL):
     predicate_name = predicate.predicate
-    
+
     if predicate_name in database:
-        return database[predicate_name]
+        return database[predicate_name].parts(version)
     else:
-        return set()
-    
-
-def is_variable(term):
-    return term[0].isupper()
+        return ()
 
 
 def join_match_with_fact(match, fact, predicate):
@@ -39,118 +41,368 @@ def join_match_with_fact(match, fact, predicate):
     return new_match
 
 
-def match_and_join(rule_body, database):
-    matches = [{}]
-    for predicate in rule_body:
-        facts_matching_predicate = get_facts_matching_predicate(predicate, database)
-        new_matches = []
+def bound_columns(predicate, bound_variables):
+    # Columns holding a constant or a variable bound by an earlier predicate
+    # can be used to probe an index of the relation instead of scanning it
+    columns = []
+    key_terms = []
+    for column, term in enumerate(predicate.terms):
+        if not is_variable(term) or term in bound_variables:
+            columns.append(column)
+            key_terms.append(term)
+    return tuple(columns), key_terms
+
+
+# Number of partial matches which the interpreted join steps pass on at a
+# time
+DEFAULT_BATCH_SIZE = 1024
+
 
-        for match in matches:
-            for fact in facts_matching_predicate:
-                # Join the current match with the current fact
-                joined_match = join_match_with_fact(match, fact, predicate)
-                if joined_match is not None:
+def join_step(batches, k, predicate, parts, columns, key_terms, tests, batch_size, counters):
+    # Extends the partial matches of the previous step with the facts of one
+    # body predicate and filters them by the comparisons placed at this step,
+    # passing the matches on whenever a batch is full
+    new_matches = []
+    for batch in batches:
+        for match in batch:
+            key = tuple(match[term] if is_variable(term) else term for term in key_terms)
+            for part in parts:
+                candidates = part.lookup(columns, key)
+                if counters is not None:
+                    counters.scanned[k] += len(candidates)
+                for fact in candidates:
+                    # Join the current match with the current fact
+                    joined_match = join_match_with_fact(match, fact, predicate)
+                    if joined_match is None or (tests and not all(test(joined_match) for test in tests)):
+                        continue
                     new_matches.append(joined_match)
+                    if batch_size is not None and len(new_matches) >= batch_size:
+                        if counters is not None:
+                            counters.matches[k] += len(new_matches)
+                        yield new_matches
+                        new_matches = []
+    if new_matches:
+        if counters is not None:
+            counters.matches[k] += len(new_matches)
+        yield new_matches
 
-        # Update the matches with the new matches for the current predicate
-        matches = new_matches
 
-    return matches
+def match_and_join(rule_body, database, counters=None, batch_size=DEFAULT_BATCH_SIZE, filters=(), values=None):
+    '''
+    Joins the body predicates left-deep as a pipeline of generators, one
+    per body predicate. Every step reads the partial matches of the step
+    before it in batches and passes its own matches on as soon as a batch is
+    full, so at most one batch per step is held in memory, whatever the size
+    of the intermediate results. Since the first predicate is usually the
+    delta, the delta is processed in chunks of the batch size. Every
+    comparison and negated atom filters the matches of the first step which
+    binds all of its variables.
 
+        Args:
+            rule_body (list): List of (predicate, version) pairs in join order
+            database (dict): Maps predicates to their VersionedRelation
+            counters (RuleCounters): Counters of the evaluation, if it is
+                                     traced
+            batch_size (int): Number of partial matches passed on at a time,
+                              or None to pass on all matches of a step at once
+            filters (list): Comparisons and negated atoms of the rule
+            values (list): Typed values of the interned constants
 
-def project_head(rule_head, match, derived_facts):
-    projected_terms = tuple(match[var] if var in match else var for var in rule_head.terms)
-    predicate = rule_head.predicate
-    derived_facts[predicate].add(projected_terms)
+        Returns:
+            matches (generator): Complete matches of the body, as dicts from
+                                 variables to terms
+    '''
+    batches = iter([[{}]])
+    bound_variables = set()
+    placed = place_filters([predicate.terms for predicate, _ in rule_body], filters)
+    for k, (predicate, version) in enumerate(rule_body):
+        parts = get_facts_matching_predicate(predicate, database, version)
+        columns, key_terms = bound_columns(predicate, bound_variables)
+        tests = [filter_test(literal, values, database) for literal in placed[k]]
+        batches = join_step(batches, k, predicate, parts, columns, key_terms, tests, batch_size, counters)
+        bound_variables.update(term for term in predicate.terms if is_variable(term))
 
+    for batch in batches:
+        yield from batch
 
-def apply_rule(rule, database, derived_facts):
-    # print(rule)
-    for match in match_and_join(rule.body, database):
-        project_head(rule.head, match, derived_facts)
-        
 
-def semi_naive_evaluation(base_facts, rules, verbose=False):
-    edb_predicates = defaultdict(set)               # q1, q2, ... , qm
-    for fact in base_facts:
-        edb_predicates[fact.fact.predicate].add(tuple(fact.fact.terms))
+def project_head(rule_head, match):
+    return tuple(match[var] if var in match else var for var in rule_head.terms)
 
 
-    idb_predicates = defaultdict(set)               # p1, p2, ..., pn
-    for rule in rules:
-        idb_predicates[rule.head.predicate] = set()
-        for predicate in rule.body:
-            if predicate.predicate not in edb_predicates:
-                idb_predicates[predicate.predicate] = set()
+def apply_rule(rule_head, rule_body, database, counters=None, batch_size=DEFAULT_BATCH_SIZE, filters=(),
+               values=None):
+    head_relation = database[rule_head.predicate]
+    for match in match_and_join(rule_body, database, counters, batch_size, filters, values):
+        head_relation.add_new(project_head(rule_head, match))
+
+
+def delta_rules(rule, idb_predicates):
+    '''
+    Rewrites a rule into its delta variants. The i-th variant reads the delta
+    of the i-th IDB predicate of the body, the old version of the IDB
+    predicates before it and the full version of the IDB predicates after it,
+    so that every derivation is found by exactly one variant.
+
+        Args:
+            rule (Rule): Rule which is to be rewritten
+            idb_predicates (dict): Names of the IDB predicates
 
-    
-    delta_small = copy.deepcopy(idb_predicates)     # delta_small(p1), delta_small(p2), ..., delta_small(pn)
+        Returns:
+            variants (list): List of bodies made of (predicate, version) pairs
+    '''
+    idb_positions = [i for i, predicate in enumerate(rule.body) if predicate.predicate in idb_predicates]
+    variants = []
+    for delta_position in idb_positions:
+        body = []
+        for i, predicate in enumerate(rule.body):
+            if i not in idb_positions or i > delta_position:
+                body.append((predicate, FULL))
+            elif i == delta_position:
+                body.append((predicate, DELTA))
+            else:
+                body.append((predicate, OLD))
+        variants.append(body)
+    return variants
 
-    # Initialize delta_small with tuples produced by rules using only EDBs
+
+def collect_statistics(database, versions=(OLD, DELTA, FULL)):
+    cardinalities = {}
+    distinct_counts = {}
+    for name, relation in database.items():
+        for version in versions:
+            parts = relation.parts(version)
+            cardinalities[(name, version)] = sum(len(part) for part in parts)
+            # The distinct keys of an index are known only if every part has it
+            for columns in parts[0].indexes:
+                if all(columns in part.indexes for part in parts):
+                    distinct_counts[(name, version, columns)] = sum(len(part.indexes[columns]) for part in parts)
+    return Statistics(cardinalities, distinct_counts)
+
+
+def semi_naive_fixpoint(base_facts, rules, verbose=False, compiled=True, base_relations=None, snapshot=None,
+                        snapshot_path=None, trace=None, closures=True, batch_size=DEFAULT_BATCH_SIZE,
+                        multiway=True):
+    '''
+    Computes the least fixpoint of a program with the semi-naive method.
+
+        Args:
+            base_facts (list): Facts of the program
+            rules (list): Rules of the program
+            verbose (Boolean): Prints the relations in every iteration
+            compiled (Boolean): Evaluates the rules with compiled join functions
+            base_relations (dict): Maps predicates to iterables of tuples of
+                                   terms which are loaded as base facts
+            snapshot (Snapshot): Materialized database from which the
+                                 evaluation continues
+            snapshot_path (str): Path to which the materialized database is
+                                 saved as a snapshot
+            trace (Trace): Records the rule and iteration events of the
+                           evaluation
+            closures (Boolean): Evaluates the strata which compute a
+                                transitive closure with a graph search
+            batch_size (int): Number of partial matches passed between the
+                              steps of the interpreted joins at a time, or
+                              None to materialize every step; the compiled
+                              join functions are nested loops and never
+                              materialize partial matches
+            multiway (Boolean): Evaluates the rules with cyclic bodies with
+                                the worst-case optimal multiway join
+
+        Returns:
+            derived (dict): Maps each IDB predicate to the Relation of its
+                            derived tuples which are not base facts
+            symbols (SymbolTable): Symbol table of the interned constants
+    '''
+    # Constants are interned at load time, so the relations hold integer
+    # tuples. A snapshot brings the symbol table its tuples were interned with
+    symbols = snapshot.symbols if snapshot else SymbolTable()
+    database = {}
+    for fact in base_facts:
+        if fact.fact.predicate not in database:
+            database[fact.fact.predicate] = VersionedRelation()
+        database[fact.fact.predicate].stable.add(symbols.encode(fact.fact.terms))
+    for name, rows in (base_relations or {}).items():
+        if name not in database:
+            database[name] = VersionedRelation()
+        relation = database[name].stable
+        for terms in rows:
+            relation.add(symbols.encode(terms))
+    rules = [symbols.encode_rule(rule) for rule in rules]
+
+    idb_predicates = dict.fromkeys(rule.head.predicate for rule in rules)    # p1, p2, ..., pn
     for rule in rules:
-        apply_rule(rule, edb_predicates, delta_small)
+        for predicate in [rule.head] + rule.body + rule.negations:
+            if predicate.predicate not in database:
+                database[predicate.predicate] = VersionedRelation()
 
-    i = 1
-    while any(delta_small.values()):
-        for predicate, tuple_set in delta_small.items():
-            idb_predicates[predicate].update(tuple_set)
-        
-        # print(idb_predicates)
-        delta_big = calculate_delta_big(rules, copy.deepcopy(idb_predicates), copy.deepcopy(delta_small), copy.deepcopy(edb_predicates))
-        
-        for predicate, tuple_set in idb_predicates.items():
-            if predicate in delta_small:
-                delta_small[predicate] = delta_big[predicate] - tuple_set
-        if verbose:
-            print(f"<---------- Iteration {i} ---------->")
-            print(f"p[{i}]:")
-            print(convert_to_datalog_format(idb_predicates))
-            print(f"delta(p[{i}]):")
-            print(convert_to_datalog_format(delta_small))
-                    
-        i += 1
-    return convert_to_datalog_format(idb_predicates)
-
-
-def merge_dicts(dict1, dict2):
-    '''Merge two defaultdicts and return the result.'''
-    result = defaultdict(set)
-    for key, value_set in dict1.items():
-        result[key].update(value_set)
-    for key, value_set in dict2.items():
-        result[key].update(value_set)
-    return result
-
-
-def combine_databases(idb_predicates, predicate, delta_small, edb_predicates):
-    # Remove the key-value pair associated with 'predicate'
-    idb_predicates.pop(predicate, None)
-    
-    # Merge the dictionaries
-    temp_result = merge_dicts(idb_predicates, delta_small)
-    final_database = merge_dicts(temp_result, edb_predicates)
-    
-    return final_database
-
-
-def apply_rule_with_delta(rule, idb_predicates, delta_small, edb_predicates, delta_big):
-    idb_rule_predicates = []
-    edb_rule_predicates = []
-    for predicate in rule.body:
-        if predicate.predicate in edb_predicates:
-            edb_rule_predicates.append(predicate.predicate)
+    # Only the relations of a snapshot which the program uses are copied into
+    # the database, which costs time in their size; the others stay in the
+    # map and are never copied
+    snapshot_predicates = [name for name in snapshot.names() if name in database] if snapshot else []
+    for name in snapshot_predicates:
+        database[name].stable.update(snapshot.tuples(name, BASE))
+    output_predicates = dict(idb_predicates)
+    output_predicates.update((name, None) for name in snapshot_predicates if snapshot.count(name, DERIVED))
+    base_tuples = {predicate: set(database[predicate].stable) for predicate in output_predicates}
+    for name in snapshot_predicates:
+        database[name].stable.update(snapshot.tuples(name, DERIVED))
+
+    # The comparisons compare the typed values of the interned constants
+    values = symbols.values()
+
+    # Rules are evaluated either by compiled join functions or by the
+    # interpreted match_and_join
+    compiler = RuleCompiler()
+
+    def evaluate(rule, body, statistics):
+        # body is in source order. A cyclic body is evaluated by the multiway
+        # join, which binds one variable at a time; the others are joined
+        # pairwise in the planned join order. Both apply the comparisons and
+        # the negated atoms of the rule as soon as their variables are bound
+        rule_head = rule.head
+        filters = rule_filters(rule)
+        target = database
+        aggregator = None
+        if has_aggregates(rule):
+            # The matches are folded into the groups of the aggregates, which
+            # stand in for the head relation during the join
+            aggregator = GroupAggregator(rule.head, symbols)
+            rule_head = aggregator.head
+            target = dict(database)
+            target[rule_head.predicate] = aggregator
+
+        if multiway and is_cyclic(body):
+            join_order = variable_order(body, statistics)
+
+            def join_body(counters=None):
+                trie_join(rule_head, body, join_order, target, counters, filters, values)
         else:
-            idb_rule_predicates.append(predicate.predicate)
-    
-    for predicate in idb_rule_predicates:
-        database = combine_databases(idb_predicates, predicate, delta_small, edb_predicates)
-        for match in match_and_join(rule.body, database):
-            project_head(rule.head, match, delta_big)
+            planned = plan_body(body, statistics)
+            join_order = [predicate.predicate for predicate, _ in planned]
 
+            def join_body(counters=None):
+                if not compiled:
+                    apply_rule(rule_head, planned, target, counters, batch_size, filters, values)
+                elif counters is None:
+                    compiler.get(rule_head, planned, filters=filters, values=values)(target)
+                else:
+                    compiler.get(rule_head, planned, instrumented=True, filters=filters,
+                                 values=values)(target, counters.scanned, counters.matches)
 
-def calculate_delta_big(rules, idb_predicates, delta_small, edb_predicates):
-    delta_big = defaultdict(set, {key: set() for key in idb_predicates.keys()})
-    for rule in rules:
-        apply_rule_with_delta(rule, idb_predicates, delta_small, edb_predicates, delta_big)
-    
-    return delta_big
+        def join(counters=None):
+            join_body(counters)
+            if aggregator is not None:
+                aggregator.flush(database[rule.head.predicate])
+
+        if trace is None or not trace.rules:
+            join()
+            return
+
+        counters = RuleCounters(len(join_order))
+        head_relation = database[rule_head.predicate]
+        size = len(head_relation.new)
+        start = time.perf_counter()
+        join(counters)
+        elapsed = time.perf_counter() - start
+        trace.rule(stratum_index, iteration, format_rule(rule.head, body, symbols, rule.comparisons, rule.negations),
+                   join_order, counters, elapsed, len(head_relation.new) - size)
+
+    def record_iteration(predicates, start):
+        if trace is not None:
+            trace.iteration(stratum_index, iteration, time.perf_counter() - start,
+                            {predicate: len(database[predicate].delta) for predicate in predicates})
+
+    def advance(predicates):
+        changed = False
+        for predicate in predicates:
+            changed = database[predicate].advance() or changed
+        return changed
+
+    # The strata are evaluated in topological order of the predicate
+    # dependency graph, so the predicates of earlier strata are complete and
+    # are read like EDB predicates
+    i = 1
+    for stratum_index, stratum in enumerate(stratify(rules)):
+        # Initialize the delta with tuples produced by the rules using the
+        # full database, in which the predicates of the stratum only hold
+        # their base facts
+        iteration = 0
+        start = time.perf_counter()
+        statistics = collect_statistics(database)
+        for rule in stratum.rules:
+            body = [(predicate, FULL) for predicate in rule.body]
+            evaluate(rule, body, statistics)
+        changed = advance(stratum.predicates)
+        record_iteration(stratum.predicates, start)
+
+        # A non-recursive stratum is complete after a single pass
+        if not stratum.recursive:
+            advance(stratum.predicates)
+            continue
+
+        # A transitive closure is completed from its seeds in a single pass
+        # by a graph search instead of the delta rules
+        closure = recognize_closure(stratum) if closures else None
+        if closure is not None:
+            iteration += 1
+            start = time.perf_counter()
+            relation = database[closure.predicate]
+            edges = None if closure.edge == closure.predicate else database[closure.edge]
+            tuples = set(evaluate_closure(closure, relation, edges))
+            relation.new.update(tuples.difference(relation.stable.tuples, relation.delta.tuples))
+            advance(stratum.predicates)
+            record_iteration(stratum.predicates, start)
+            advance(stratum.predicates)
+            continue
+
+        variants = [(rule, body) for rule in stratum.rules for body in delta_rules(rule, stratum.predicates)]
+        if compiled:
+            for rule, body in variants:
+                if not (multiway and is_cyclic(body)):
+                    compiler.get(rule.head, plan_body(body, statistics), filters=rule_filters(rule), values=values)
+
+        while changed:
+            iteration += 1
+            start = time.perf_counter()
+            # Join orders are chosen again in every iteration, since the sizes
+            # of the deltas and of the IDB relations change between iterations
+            statistics = collect_statistics(database)
+            for rule, body in variants:
+                evaluate(rule, body, statistics)
+
+            if verbose:
+                print(f"<---------- Iteration {i} ---------->")
+                print(f"p[{i}]:")
+                print(convert_to_datalog_format({predicate: database[predicate] for predicate in idb_predicates}, symbols))
+
+            changed = advance(stratum.predicates)
+            record_iteration(stratum.predicates, start)
+
+            if verbose:
+                print(f"delta(p[{i}]):")
+                print(convert_to_datalog_format({predicate: database[predicate].delta for predicate in stratum.predicates}, symbols))
+
+            i += 1
+
+    derived = {predicate: database[predicate].stable.difference(base_tuples[predicate]) for predicate in output_predicates}
+    unused_predicates = [name for name in snapshot.names() if name not in database] if snapshot else []
+    for name in unused_predicates:
+        if snapshot.count(name, DERIVED):
+            derived[name] = snapshot.tuples(name, DERIVED)
+
+    if snapshot_path:
+        relations = {name: (base_tuples[name], derived[name]) if name in base_tuples else (relation.stable, ())
+                     for name, relation in database.items()}
+        for name in unused_predicates:
+            relations[name] = (snapshot.tuples(name, BASE), snapshot.tuples(name, DERIVED))
+        save_snapshot(snapshot_path, symbols, relations)
+
+    return derived, symbols
+
+
+def semi_naive_evaluation(base_facts, rules, verbose=False, compiled=True, base_relations=None, closures=True,
+                          batch_size=DEFAULT_BATCH_SIZE, multiway=True):
+    derived, symbols = semi_naive_fixpoint(base_facts, rules, verbose, compiled, base_relations, closures=closures,
+                                           batch_size=batch_size, multiway=multiway)
+    return convert_to_datalog_format(derived, symbols)
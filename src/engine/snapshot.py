@@ -0,0 +1,149 @@
+import json
+import mmap
+import os
+import sys
+from array import array
+from ..model.symbols import SymbolTable
+
+
+# A snapshot starts with the magic bytes and the length of its JSON header,
+# followed by the symbols and the columns of the relations, each aligned to
+# 8 bytes
+MAGIC = b"DLSNAP1\n"
+PREFIX = len(MAGIC) + 8
+
+# Parts of a relation in a snapshot
+BASE = "base"
+DERIVED = "derived"
+
+
+def align(offset):
+    return (offset + 7) & ~7
+
+
+def relation_columns(tuples, arity):
+    # Stores the tuples column by column as 64-bit integers
+    tuples = tuples if isinstance(tuples, (list, tuple)) else list(tuples)
+    return [array('q', (fact[column] for fact in tuples)) for column in range(arity)], len(tuples)
+
+
+def save_snapshot(path, symbols, relations):
+    '''
+    Writes a materialized database to a binary snapshot. The file is written
+    next to the path and moved over it at the end, so that a snapshot which
+    is being read can be replaced.
+
+        Args:
+            path (str): Path of the snapshot
+            symbols (SymbolTable): Symbol table of the interned terms
+            relations (dict): Maps each predicate to a pair of iterables of
+                              its base tuples and its derived tuples
+
+        Returns:
+            None
+    '''
+    blocks = []
+    offset = 0
+
+    def place(block):
+        nonlocal offset
+        start = offset
+        blocks.append((start, block))
+        offset = align(start + len(block))
+        return start
+
+    symbol_data = "\n".join(symbols.symbols).encode()
+    header = {
+        "byteorder": sys.byteorder,
+        "symbols": [place(symbol_data), len(symbol_data), len(symbols)],
+        "relations": {},
+    }
+    for name, (base, derived) in relations.items():
+        base = list(base)
+        derived = list(derived)
+        arity = len(base[0]) if base else len(derived[0]) if derived else 0
+        entry = {"arity": arity}
+        for part, tuples in ((BASE, base), (DERIVED, derived)):
+            columns, count = relation_columns(tuples, arity)
+            entry[part] = [offset, count]
+            for column in columns:
+                place(column.tobytes())
+        header["relations"][name] = entry
+
+    header_data = json.dumps(header).encode()
+    start = align(PREFIX + len(header_data))
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header_data).to_bytes(8, "little"))
+        f.write(header_data)
+        for block_offset, block in blocks:
+            f.seek(start + block_offset)
+            f.write(block)
+    os.replace(temporary, path)
+
+
+class Snapshot(object):
+    '''
+    A binary snapshot opened through a memory map. The columns of the
+    relations are exposed as views of the mapped file, so opening a snapshot
+    only reads its header and symbols; the tuples are read when they are
+    iterated. An engine which evaluates rules on a relation copies its
+    tuples into its own relations, so only the relations which are merely
+    scanned are served from the map without copies.
+    '''
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < PREFIX:
+                raise Exception(f"{path} is not a snapshot.")
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise Exception(f"{path} is not a snapshot.")
+        length = int.from_bytes(self.data[len(MAGIC):PREFIX], "little")
+        header = json.loads(self.data[PREFIX:PREFIX + length])
+        if header["byteorder"] != sys.byteorder:
+            raise Exception(f"{path} was written on a machine with a different byte order.")
+        self.view = memoryview(self.data)[align(PREFIX + length):]
+        self.relations = header["relations"]
+
+        offset, size, count = header["symbols"]
+        symbols = bytes(self.view[offset:offset + size]).decode().split("\n") if count else []
+        self.symbols = SymbolTable(symbols)
+
+    def names(self):
+        return list(self.relations)
+
+    def arity(self, name):
+        return self.relations[name]["arity"]
+
+    def count(self, name, part):
+        return self.relations[name][part][1] if name in self.relations else 0
+
+    def columns(self, name, part):
+        '''
+        Returns the columns of a part of a relation without copying them.
+
+            Args:
+                name (str): Predicate of the relation
+                part (str): BASE or DERIVED
+
+            Returns:
+                columns (list): Memory views of 64-bit integers, one for each
+                                column
+        '''
+        entry = self.relations[name]
+        offset, count = entry[part]
+        size = count * 8
+        return [self.view[offset + i * align(size):offset + i * align(size) + size].cast('q')
+                for i in range(entry["arity"])]
+
+    def tuples(self, name, part):
+        # Tuples of a part of a relation, read from the columns as they are
+        # iterated
+        if name not in self.relations:
+            return iter(())
+        return zip(*self.columns(name, part))
+
+
+def load_snapshot(path):
+    return Snapshot(path)
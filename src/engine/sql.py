@@ -0,0 +1,272 @@
+import itertools
+import sqlite3
+from .stratification import stratify, is_monotonic
+from ..model.symbols import SymbolTable, is_variable, term_value
+from ..utilities.writer import format_facts
+
+
+# Size of the page cache of the connection in KiB. The tables live in the
+# database file, so only this much of them is held in memory
+CACHE_SIZE = 64 * 1024
+
+
+# Table of the typed values of the interned constants, which the comparisons
+# read. SQLite orders numbers before text, as the typed values are ordered
+SYMBOLS = '"symbols"'
+
+
+def table(name, part="rel"):
+    # Every predicate has a main table, and the IDB predicates also have the
+    # tables of their delta, of their new tuples and of their base facts
+    return f'"{part}:{name}"'
+
+
+def create_table(connection, name, arity, part="rel"):
+    # The primary key on all columns removes duplicates and stores the
+    # tuples in a B-tree ordered by the columns
+    columns = ", ".join(f"c{i} INTEGER NOT NULL" for i in range(arity))
+    key = ", ".join(f"c{i}" for i in range(arity))
+    connection.execute(f"CREATE TABLE {table(name, part)} ({columns}, PRIMARY KEY ({key})) WITHOUT ROWID")
+
+
+def join_columns(rule):
+    '''
+    Finds the columns through which the body predicates of a rule are joined
+    or filtered: the columns of constants and of variables which occur in
+    another body predicate.
+
+        Args:
+            rule (Rule): Rule of the program
+
+        Returns:
+            columns (list): Pairs of a predicate and a tuple of its columns
+    '''
+    occurrences = {}
+    for k, predicate in enumerate(rule.body):
+        for term in set(predicate.terms):
+            if is_variable(term):
+                occurrences.setdefault(term, set()).add(k)
+    columns = []
+    for k, predicate in enumerate(rule.body):
+        bound = tuple(column for column, term in enumerate(predicate.terms)
+                      if not is_variable(term) or len(occurrences[term]) > 1)
+        if bound:
+            columns.append((predicate.predicate, bound))
+    return columns
+
+
+def column_value(value):
+    # Integers beyond 64 bits are stored as reals, which SQLite compares with
+    # the integers by value
+    value = value[1]
+    if isinstance(value, int) and not -2 ** 63 <= value < 2 ** 63:
+        return float(value)
+    return value
+
+
+def sql_literal(value):
+    value = column_value(value)
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return repr(value)
+
+
+def rule_statement(rule_head, body, comparisons=()):
+    '''
+    Translates a rule (or a delta variant of a rule) into an INSERT ... SELECT
+    statement which adds its head tuples to the table of the new tuples of
+    the head predicate, unless they are already in its main table. The
+    comparisons become conditions on the typed values of the bound
+    constants, which SQLite checks as soon as their columns are read.
+
+        Args:
+            rule_head (Predicate): Head of the rule
+            body (list): List of (predicate, table) pairs
+            comparisons (list): Comparisons of the rule
+
+        Returns:
+            statement (str): SQL statement
+    '''
+    sources = []
+    conditions = []
+    bindings = {}
+    for k, (predicate, source) in enumerate(body):
+        sources.append(f"{source} AS t{k}")
+        for column, term in enumerate(predicate.terms):
+            reference = f"t{k}.c{column}"
+            if not is_variable(term):
+                # Interned constants are integers, so they are inlined
+                conditions.append(f"{reference} = {term}")
+            elif term in bindings:
+                conditions.append(f"{reference} = {bindings[term]}")
+            else:
+                bindings[term] = reference
+
+    for comparison in comparisons:
+        left, right = (f"(SELECT value FROM {SYMBOLS} WHERE id = {bindings[term]})" if is_variable(term)
+                       else sql_literal(term_value(term)) for term in comparison.terms)
+        conditions.append(f"{left} {comparison.operator} {right}")
+
+    head = [bindings[term] if is_variable(term) else str(term) for term in rule_head.terms]
+    existing = " AND ".join(f"r.c{i} = {expression}" for i, expression in enumerate(head))
+    conditions.append(f"NOT EXISTS (SELECT 1 FROM {table(rule_head.predicate)} AS r WHERE {existing})")
+    return (f"INSERT OR IGNORE INTO {table(rule_head.predicate, 'new')} SELECT {', '.join(head)} "
+            f"FROM {', '.join(sources)} WHERE {' AND '.join(conditions)}")
+
+
+def delta_statements(rule, stratum_predicates):
+    # One variant for every body predicate of the stratum, reading its delta
+    # and the main tables of all other body predicates
+    statements = []
+    for i, predicate in enumerate(rule.body):
+        if predicate.predicate in stratum_predicates:
+            body = [(other, table(other.predicate, "delta" if j == i else "rel")) for j, other in enumerate(rule.body)]
+            statements.append(rule_statement(rule.head, body, rule.comparisons))
+    return statements
+
+
+def rows(connection, query):
+    # The tuples are read from the database as they are iterated
+    yield from connection.execute(query)
+
+
+def sql_fixpoint(base_facts, rules, verbose=False, base_relations=None, path=None):
+    '''
+    Computes the least fixpoint of a program with the semi-naive method
+    inside a SQLite database, so that the relations are stored on disk
+    rather than in memory. Every predicate gets a table of integer columns
+    with a primary key on all columns and indexes on the columns the rules
+    join on, and every rule is translated into INSERT ... SELECT statements
+    which are run until no new tuples are derived.
+
+        Args:
+            base_facts (list): Facts of the program
+            rules (list): Rules of the program
+            verbose (Boolean): Prints the delta sizes in every iteration
+            base_relations (dict): Maps predicates to iterables of tuples of
+                                   terms which are loaded as base facts
+            path (str): Path of the database file, whose tables are replaced,
+                        or None for a temporary database which is deleted
+                        when the derived tuples have been read
+
+        Returns:
+            derived (dict): Maps each IDB predicate to a generator of its
+                            derived tuples which are not base facts
+            symbols (SymbolTable): Symbol table of the interned constants
+    '''
+    if not is_monotonic(rules):
+        raise Exception("The sqlite evaluation method does not support negation and aggregates.")
+
+    symbols = SymbolTable()
+    rules = [symbols.encode_rule(rule) for rule in rules]
+    idb_predicates = dict.fromkeys(rule.head.predicate for rule in rules)
+
+    arities = {}
+
+    def set_arity(name, arity):
+        if arities.setdefault(name, arity) != arity:
+            raise Exception(f"Predicate {name} is used with {arities[name]} and {arity} arguments.")
+
+    # Every predicate has a list of sources of its base facts. The rows of a
+    # base relation are streamed into its table, so its first row is read
+    # ahead to find the arity
+    sources = {}
+    for fact in base_facts:
+        set_arity(fact.fact.predicate, len(fact.fact.terms))
+        sources.setdefault(fact.fact.predicate, [[]])[0].append(fact.fact.terms)
+    for name, relation_rows in (base_relations or {}).items():
+        relation_rows = iter(relation_rows)
+        first = next(relation_rows, None)
+        if first is not None:
+            set_arity(name, len(first))
+            sources.setdefault(name, []).append(itertools.chain([first], relation_rows))
+    for rule in rules:
+        for predicate in [rule.head] + rule.body:
+            set_arity(predicate.predicate, len(predicate.terms))
+
+    # An empty path opens a private temporary database on disk, which SQLite
+    # deletes when the connection is closed
+    connection = sqlite3.connect(path or "", isolation_level=None)
+    connection.execute(f"PRAGMA cache_size = -{CACHE_SIZE}")
+    connection.execute("PRAGMA journal_mode = OFF")
+    connection.execute("PRAGMA synchronous = OFF")
+    connection.execute("BEGIN")
+    for name, arity in arities.items():
+        for part in ["rel", "base", "delta", "new"] if name in idb_predicates else ["rel"]:
+            connection.execute(f"DROP TABLE IF EXISTS {table(name, part)}")
+            create_table(connection, name, arity, part)
+
+    for name, name_sources in sources.items():
+        # The base facts of an IDB predicate are kept apart, so that they can
+        # be left out of the derived tuples
+        target = table(name, "base" if name in idb_predicates else "rel")
+        placeholders = ", ".join("?" * arities[name])
+        for relation_rows in name_sources:
+            connection.executemany(f"INSERT OR IGNORE INTO {target} VALUES ({placeholders})",
+                                   (symbols.encode(terms) for terms in relation_rows))
+        if name in idb_predicates:
+            connection.execute(f"INSERT INTO {table(name)} SELECT * FROM {target}")
+
+    if any(rule.comparisons for rule in rules):
+        connection.execute(f"DROP TABLE IF EXISTS {SYMBOLS}")
+        connection.execute(f"CREATE TABLE {SYMBOLS} (id INTEGER PRIMARY KEY, value)")
+        connection.executemany(f"INSERT INTO {SYMBOLS} VALUES (?, ?)",
+                               enumerate(column_value(value) for value in symbols.values()))
+
+    # The indexes are built after loading, which is faster than maintaining
+    # them during the bulk insertion. A prefix of the primary key needs none
+    indexes = set()
+    for rule in rules:
+        for name, columns in join_columns(rule):
+            if columns != tuple(range(len(columns))) and (name, columns) not in indexes:
+                indexes.add((name, columns))
+                index_name = f'"index:{name}:{"_".join(map(str, columns))}"'
+                connection.execute(f"CREATE INDEX {index_name} ON {table(name)} "
+                                   f"({', '.join(f'c{column}' for column in columns)})")
+    connection.execute("ANALYZE")
+
+    def advance(predicates):
+        # The new tuples become the delta and are added to the main tables
+        changed = 0
+        for name in predicates:
+            connection.execute(f"DELETE FROM {table(name, 'delta')}")
+            changed += connection.execute(f"INSERT INTO {table(name, 'delta')} SELECT * FROM {table(name, 'new')}").rowcount
+            connection.execute(f"INSERT INTO {table(name)} SELECT * FROM {table(name, 'new')}")
+            connection.execute(f"DELETE FROM {table(name, 'new')}")
+        return changed
+
+    i = 1
+    for stratum in stratify(rules):
+        # The initial pass evaluates the rules on the main tables, in which
+        # the predicates of the stratum only hold their base facts
+        for rule in stratum.rules:
+            connection.execute(rule_statement(rule.head, [(predicate, table(predicate.predicate)) for predicate in rule.body],
+                                              rule.comparisons))
+        changed = advance(stratum.predicates)
+        if not stratum.recursive:
+            continue
+
+        statements = [statement for rule in stratum.rules for statement in delta_statements(rule, stratum.predicates)]
+        while changed:
+            for statement in statements:
+                connection.execute(statement)
+            changed = advance(stratum.predicates)
+            if verbose:
+                print(f"<---------- Iteration {i} ---------->")
+                for name in stratum.predicates:
+                    count = connection.execute(f"SELECT COUNT(*) FROM {table(name, 'delta')}").fetchone()[0]
+                    print(f"delta({name}): {count} tuples")
+            i += 1
+    connection.execute("COMMIT")
+
+    derived = {}
+    for name in idb_predicates:
+        existing = " AND ".join(f"b.c{i} = r.c{i}" for i in range(arities[name]))
+        derived[name] = rows(connection, f"SELECT * FROM {table(name)} AS r "
+                                         f"WHERE NOT EXISTS (SELECT 1 FROM {table(name, 'base')} AS b WHERE {existing})")
+    return derived, symbols
+
+
+def sql_evaluation(base_facts, rules, verbose=False, base_relations=None, path=None):
+    derived, symbols = sql_fixpoint(base_facts, rules, verbose, base_relations, path)
+    return "\n".join(format_facts(derived, symbols))
@@ -0,0 +1,132 @@
+from ..model.symbols import is_aggregate
+
+
+def dependency_graph(rules):
+    '''
+    Builds the predicate dependency graph of a program.
+
+        Args:
+            rules (list): Rules of the program
+
+        Returns:
+            graph (dict): Maps each head predicate to the set of IDB
+                          predicates occurring in the bodies of its rules,
+                          negated or not
+    '''
+    graph = {rule.head.predicate: set() for rule in rules}
+    for rule in rules:
+        for predicate in rule.body + rule.negations:
+            if predicate.predicate in graph:
+                graph[rule.head.predicate].add(predicate.predicate)
+    return graph
+
+
+def nonmonotonic_dependencies(rule):
+    '''
+    Returns the predicates on which the head of a rule depends
+    non-monotonically, so that they must be complete before the rule is
+    evaluated: the negated predicates, and every body predicate if the head
+    has aggregates.
+
+        Args:
+            rule (Rule): Rule of the program
+
+        Returns:
+            predicates (set): Names of the predicates
+    '''
+    predicates = {predicate.predicate for predicate in rule.negations}
+    if any(is_aggregate(term) for term in rule.head.terms):
+        predicates.update(predicate.predicate for predicate in rule.body)
+    return predicates
+
+
+def is_monotonic(rules):
+    # Programs without negation and aggregates are evaluated by every engine
+    return not any(nonmonotonic_dependencies(rule) for rule in rules)
+
+
+def strongly_connected_components(graph):
+    '''
+    Computes the strongly connected components of a graph with Tarjan's
+    algorithm. A component is emitted only after every component it depends
+    on, so the result is in topological order of the dependencies.
+
+        Args:
+            graph (dict): Maps each node to the set of nodes it depends on
+
+        Returns:
+            components (list): List of lists of nodes
+    '''
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    for root in graph:
+        if root in index:
+            continue
+        # Iterative depth-first search, so that long chains of predicates do
+        # not hit the recursion limit
+        work = [(root, iter(sorted(graph[root])))]
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor not in index:
+                    index[successor] = lowlink[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(sorted(graph[successor]))))
+                    break
+                if successor in on_stack:
+                    lowlink[node] = min(lowlink[node], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+class Stratum(object):
+    def __init__(self, predicates, rules, recursive):
+        self.predicates = predicates
+        self.rules = rules
+        self.recursive = recursive
+
+    def __repr__(self):
+        return "%r" % (self.__dict__)
+
+
+def stratify(rules):
+    '''
+    Splits the rules of a program into strata, one per strongly connected
+    component of the predicate dependency graph, in an order in which every
+    stratum comes after the strata it depends on.
+
+        Args:
+            rules (list): Rules of the program
+
+        Returns:
+            strata (list): List of Stratum objects
+    '''
+    graph = dependency_graph(rules)
+    strata = []
+    for component in strongly_connected_components(graph):
+        predicates = dict.fromkeys(component)
+        component_rules = [rule for rule in rules if rule.head.predicate in predicates]
+        recursive = len(component) > 1 or component[0] in graph[component[0]]
+        strata.append(Stratum(predicates, component_rules, recursive))
+    return strata
@@ -0,0 +1,127 @@
+import json
+
+
+class RuleCounters(object):
+    '''
+    Counters of one evaluation of a rule, filled in by the join: for every
+    body predicate in join order, the number of candidate tuples read and the
+    number of partial matches which survive it.
+    '''
+    def __init__(self, atoms):
+        self.scanned = [0] * atoms
+        self.matches = [0] * atoms
+
+
+def format_predicate(predicate, symbols, version=None):
+    terms = ", ".join(symbols.symbol(term) if isinstance(term, int) else str(term) for term in predicate.terms)
+    name = f"{predicate.predicate}[{version}]" if version else predicate.predicate
+    return f"{name}({terms})"
+
+
+def format_rule(rule_head, body, symbols, comparisons=(), negations=()):
+    # body is a list of (predicate, version) pairs in source order; the
+    # versions mark the delta variants of a rule
+    literals = [format_predicate(predicate, symbols, version) for predicate, version in body]
+    literals.extend(str(comparison) for comparison in comparisons)
+    literals.extend(f"not {format_predicate(negation, symbols)}" for negation in negations)
+    return f"{format_predicate(rule_head, symbols)} :- {', '.join(literals)}."
+
+
+class Trace(object):
+    '''
+    Records what an evaluation does as a list of events. A rule event is
+    recorded for every evaluation of a rule or a delta variant, and an
+    iteration event whenever the relations of a stratum advance. Every event
+    is also passed to the callback, if there is one.
+
+    Rule events hold the wall time, the candidate tuples scanned and the
+    matches of every body predicate in join order (of every variable, for
+    the multiway join), the fan-out of each join
+    step, the derivations, the new tuples and the duplicates among the
+    derivations. Iteration events hold the wall time and the delta sizes.
+    '''
+    def __init__(self, callback=None, rules=True):
+        self.callback = callback
+        # Rules are only instrumented if their events are wanted
+        self.rules = rules
+        self.events = []
+
+    def record(self, event):
+        self.events.append(event)
+        if self.callback is not None:
+            self.callback(event)
+
+    def rule(self, stratum, iteration, label, join_order, counters, elapsed, derived):
+        '''
+        Records the evaluation of a rule.
+
+            Args:
+                stratum (int): Index of the stratum
+                iteration (int): Iteration of the stratum, 0 for the initial
+                                 pass
+                label (str): Rule or delta variant in Datalog format
+                join_order (list): Body predicates in join order, or the
+                                   variables in the order the multiway join
+                                   binds them
+                counters (RuleCounters): Counters filled in by the join
+                elapsed (float): Wall time in seconds
+                derived (int): Number of new tuples
+
+            Returns:
+                None
+        '''
+        derivations = counters.matches[-1] if counters.matches else 0
+        fanout = [matches / previous if previous else 0.0
+                  for matches, previous in zip(counters.matches, [1] + counters.matches[:-1])]
+        self.record({
+            "event": "rule",
+            "stratum": stratum,
+            "iteration": iteration,
+            "rule": label,
+            "join_order": join_order,
+            "time": elapsed,
+            "scanned": counters.scanned,
+            "matches": counters.matches,
+            "fanout": fanout,
+            "derivations": derivations,
+            "derived": derived,
+            "duplicates": derivations - derived,
+        })
+
+    def iteration(self, stratum, iteration, elapsed, deltas):
+        self.record({
+            "event": "iteration",
+            "stratum": stratum,
+            "iteration": iteration,
+            "time": elapsed,
+            "delta": deltas,
+        })
+
+    def iterations(self):
+        return sum(1 for event in self.events if event["event"] == "iteration")
+
+    def summary(self):
+        '''
+        Sums up the rule events of every rule and delta variant.
+
+            Returns:
+                rules (list): Totals of every rule, the most expensive first
+        '''
+        totals = {}
+        for event in self.events:
+            if event["event"] != "rule":
+                continue
+            total = totals.get(event["rule"])
+            if total is None:
+                total = totals[event["rule"]] = {"rule": event["rule"], "evaluations": 0, "time": 0.0, "scanned": 0,
+                                                 "derivations": 0, "derived": 0, "duplicates": 0}
+            total["evaluations"] += 1
+            total["time"] += event["time"]
+            total["scanned"] += sum(event["scanned"])
+            for field in ("derivations", "derived", "duplicates"):
+                total[field] += event[field]
+        return sorted(totals.values(), key=lambda total: total["time"], reverse=True)
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            json.dump({"summary": self.summary(), "events": self.events}, file, indent=1)
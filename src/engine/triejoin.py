@@ -0,0 +1,216 @@
+from ..model.symbols import is_variable
+from .filters import place_filters, filter_test
+
+
+def body_variables(predicate):
+    return [term for term in dict.fromkeys(predicate.terms) if is_variable(term)]
+
+
+def is_cyclic(body):
+    '''
+    Tests whether the hypergraph of a rule body, with one hyperedge for the
+    variables of every body predicate, is cyclic, by the GYO reduction:
+    variables occurring in a single hyperedge and hyperedges contained in
+    another one are removed until nothing changes. The body is acyclic if
+    at most one hyperedge is left.
+
+        Args:
+            body (list): List of (predicate, version) pairs
+
+        Returns:
+            cyclic (Boolean): True if the body is cyclic
+    '''
+    edges = [set(body_variables(predicate)) for predicate, _ in body]
+    changed = True
+    while changed and len(edges) > 1:
+        changed = False
+        for edge in edges:
+            for variable in list(edge):
+                if sum(1 for other in edges if variable in other) == 1:
+                    edge.discard(variable)
+                    changed = True
+        for i, edge in enumerate(edges):
+            if any(j != i and edge <= other for j, other in enumerate(edges)):
+                del edges[i]
+                changed = True
+                break
+    return len(edges) > 1
+
+
+def variable_order(body, statistics):
+    '''
+    Orders the variables of a rule body for the multiway join. Variables of
+    small relations come first, so that the first levels intersect the
+    deltas, and variables shared by more predicates break the ties.
+
+        Args:
+            body (list): List of (predicate, version) pairs
+            statistics (Statistics): Current relation statistics
+
+        Returns:
+            variables (list): Variables of the body in the order they are bound
+    '''
+    smallest = {}
+    occurrences = {}
+    for predicate, version in body:
+        size = statistics.cardinality(predicate.predicate, version)
+        for variable in body_variables(predicate):
+            smallest[variable] = min(smallest.get(variable, size), size)
+            occurrences[variable] = occurrences.get(variable, 0) + 1
+    position = {variable: i for i, variable in enumerate(smallest)}
+    return sorted(smallest, key=lambda variable: (smallest[variable], -occurrences[variable], position[variable]))
+
+
+def trie_columns(predicate, variables):
+    # The constant columns come first, then the variable columns in the
+    # order the variables are bound
+    level = {variable: i for i, variable in enumerate(variables)}
+    constants = [column for column, term in enumerate(predicate.terms) if not is_variable(term)]
+    columns = sorted((column for column, term in enumerate(predicate.terms) if is_variable(term)),
+                     key=lambda column: (level[predicate.terms[column]], column))
+    return tuple(constants + columns)
+
+
+def trie_join(rule_head, body, variables, database, counters=None, filters=(), values=None):
+    '''
+    Evaluates a rule with a worst-case optimal multiway join (generic join).
+    Instead of joining the body predicates pairwise, the variables are bound
+    one at a time: the values of a variable are the intersection of the
+    matching levels of the tries of every body predicate containing it,
+    enumerated from the smallest of them. No partial match is produced that
+    is not consistent with every body predicate, so the work is bounded by
+    the largest possible output of the body, however large the pairwise
+    intermediate results would be. Every comparison and negated atom filters
+    the values of the variable which is bound last of its variables.
+
+        Args:
+            rule_head (Predicate): Head of the rule
+            body (list): List of (predicate, version) pairs
+            variables (list): Variables of the body in the order they are bound
+            database (dict): Maps predicates to their VersionedRelation
+            counters (RuleCounters): Counters of the evaluation, one for every
+                                     variable, if it is traced
+            filters (list): Comparisons and negated atoms of the rule
+            values (list): Typed values of the interned constants
+
+        Returns:
+            None
+    '''
+    # The nodes of a body predicate are the current levels of the tries of
+    # the parts of its relation, after its constants
+    nodes = []
+    levels = []
+    for predicate, version in body:
+        if predicate.predicate not in database:
+            return
+        if not any(is_variable(term) for term in predicate.terms):
+            # A ground atom binds no variable, so it only has to hold. Its
+            # trie path ends in a leaf rather than in a level
+            if not any(predicate.terms in part for part in database[predicate.predicate].parts(version)):
+                return
+            continue
+        columns = trie_columns(predicate, variables)
+        constants = [predicate.terms[column] for column in columns if not is_variable(predicate.terms[column])]
+        atom_nodes = []
+        for part in database[predicate.predicate].parts(version):
+            if not part:
+                continue
+            node = part.trie(columns)
+            for constant in constants:
+                node = node.get(constant)
+                if node is None:
+                    break
+            else:
+                atom_nodes.append(node)
+        if not atom_nodes:
+            return
+        nodes.append(atom_nodes)
+        levels.append([predicate.terms[column] for column in columns[len(constants):]])
+
+    # For every variable, the body predicates containing it and the number of
+    # their columns it occupies
+    participants = [[(atom, atom_levels.count(variable)) for atom, atom_levels in enumerate(levels)
+                     if variable in atom_levels] for variable in variables]
+    # Levels at which every body predicate holds the variable in a single
+    # column
+    single = [all(repeats == 1 for _, repeats in atoms) for atoms in participants]
+    head = [variables.index(term) if is_variable(term) else None for term in rule_head.terms]
+    constants = rule_head.terms
+    add_new = database[rule_head.predicate].add_new
+    binding = [None] * len(variables)
+    last = len(variables) - 1
+    positions = {variable: i for i, variable in enumerate(variables)}
+    tests = [[filter_test(literal, values, database, positions) for literal in placed]
+             for placed in place_filters([(variable,) for variable in variables] or [()], filters)]
+
+    def emit():
+        add_new(tuple(constants[i] if slot is None else binding[slot] for i, slot in enumerate(head)))
+
+    def accepts(depth, value):
+        binding[depth] = value
+        return all(test(binding) for test in tests[depth])
+
+    def join(depth):
+        atoms = participants[depth]
+        saved = [nodes[atom] for atom, _ in atoms]
+        if single[depth] and all(len(atom_nodes) == 1 for atom_nodes in saved):
+            # Every body predicate has a single trie level for the variable,
+            # so the values are the keys of the smallest level which are
+            # found in all other levels
+            tries = [atom_nodes[0] for atom_nodes in saved]
+            smallest = min(tries, key=len)
+            others = [trie for trie in tries if trie is not smallest]
+            if len(others) == 1:
+                other = others[0]
+                found = [value for value in smallest if value in other]
+            else:
+                found = [value for value in smallest if all(value in other for other in others)]
+            if tests[depth]:
+                found = [value for value in found if accepts(depth, value)]
+            if counters is not None:
+                counters.scanned[depth] += len(smallest)
+                counters.matches[depth] += len(found)
+            if depth == last:
+                for value in found:
+                    binding[depth] = value
+                    emit()
+                return
+            for value in found:
+                for (atom, _), trie in zip(atoms, tries):
+                    nodes[atom] = [trie[value]]
+                binding[depth] = value
+                join(depth + 1)
+        else:
+            # The values are enumerated from the smallest union of levels and
+            # looked up in the other ones
+            smallest = min(range(len(atoms)), key=lambda i: sum(len(node) for node in saved[i]))
+            candidates = saved[smallest][0] if len(saved[smallest]) == 1 else set().union(*saved[smallest])
+            if counters is not None:
+                counters.scanned[depth] += len(candidates)
+            for value in candidates:
+                for (atom, repeats), atom_nodes in zip(atoms, saved):
+                    children = [node[value] for node in atom_nodes if value in node]
+                    # A repeated variable descends once for every column it
+                    # occupies
+                    for _ in range(repeats - 1):
+                        children = [child[value] for child in children if value in child]
+                    if not children:
+                        break
+                    nodes[atom] = children
+                else:
+                    if tests[depth] and not accepts(depth, value):
+                        continue
+                    if counters is not None:
+                        counters.matches[depth] += 1
+                    binding[depth] = value
+                    if depth == last:
+                        emit()
+                    else:
+                        join(depth + 1)
+        for (atom, _), atom_nodes in zip(atoms, saved):
+            nodes[atom] = atom_nodes
+
+    if variables:
+        join(0)
+    elif all(test(binding) for test in tests[0]):
+        emit()
@@ -0,0 +1,76 @@
+import mmap
+import os
+
+
+def get_delimiter(path):
+    # Tab-separated unless the file is a .csv file
+    return b"," if path.lower().endswith(".csv") else b"\t"
+
+
+def read_delimited(path, arity=None):
+    '''
+    Streams the rows of a delimited file of ground facts, one tuple of terms
+    per line, through a memory-mapped view of the file. Empty lines and lines
+    starting with % are skipped.
+
+        Args:
+            path (str): Path of a .tsv or .csv file
+            arity (int): Expected number of columns, or None to take the
+                         number of columns of the first row
+
+        Returns:
+            rows (generator): Tuples of terms
+    '''
+    delimiter = get_delimiter(path)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for lineno, line in enumerate(iter(data.readline, b""), start=1):
+                line = line.strip()
+                if not line or line.startswith(b"%"):
+                    continue
+                row = tuple(term.strip().decode() for term in line.split(delimiter))
+                if arity is None:
+                    arity = len(row)
+                elif len(row) != arity:
+                    raise Exception(f"Line {lineno} of {path} has {len(row)} columns, expected {arity}.")
+                if not all(row):
+                    raise Exception(f"Line {lineno} of {path} has an empty column.")
+                yield row
+
+
+def parse_fact_sources(specifications):
+    '''
+    Parses --facts options of the form predicate=path.
+
+        Args:
+            specifications (list): Option values
+
+        Returns:
+            sources (dict): Maps each predicate to the list of its files
+    '''
+    sources = {}
+    for specification in specifications:
+        predicate, separator, path = specification.partition("=")
+        if not separator or not predicate or not path:
+            raise Exception(f"Invalid fact source {specification}, expected predicate=path.")
+        sources.setdefault(predicate, []).append(path)
+    return sources
+
+
+def load_relations(sources):
+    '''
+    Returns the rows of every predicate as a generator over its files, so
+    that the engines read the rows straight into their relation storage.
+
+        Args:
+            sources (dict): Maps each predicate to the list of its files
+
+        Returns:
+            relations (dict): Maps each predicate to a generator of tuples
+    '''
+    def rows(paths):
+        for path in paths:
+            yield from read_delimited(path)
+    return {predicate: rows(paths) for predicate, paths in sources.items()}
@@ -1,5 +1,12 @@
 import ply.yacc as yacc
-from ..model.model import Fact, Rule, Predicate
+from ..model.model import Fact, Rule, Predicate, Query, Comparison, Aggregate, AGGREGATE_FUNCTIONS
+
+
+def check_no_aggregates(literals):
+    # Aggregates can only be terms of rule heads
+    for literal in literals:
+        if any(isinstance(term, Aggregate) for term in literal.terms):
+            raise Exception("Aggregates can only occur in the head of a rule.")
 
 
 class Parser(object):
@@ -16,9 +23,24 @@ class Parser(object):
         elif len(p) == 3:
             p[0] = p[1] + p[2]
 
+    def p_program_query(self, p):
+        '''program : facts rules query
+                | facts query
+                | rules query
+                | query'''
+        # A query on its own is answered from a loaded snapshot
+        if len(p) == 2:
+            p[0] = [p[1]]
+        elif len(p) == 3:
+            p[0] = p[1] + [p[2]]
+        elif len(p) == 4:
+            p[0] = p[1] + p[2] + [p[3]]
+
     def p_facts_list(self, p):
         '''facts : facts fact'''
-        p[0] = p[1] + [p[2]]
+        # Appending in place keeps parsing linear in the number of facts
+        p[1].append(p[2])
+        p[0] = p[1]
 
     def p_facts(self, p):
         '''facts :  fact'''
@@ -26,12 +48,14 @@ class Parser(object):
 
     def p_fact(self, p):
         '''fact : block DOT'''
+        check_no_aggregates([p[1]])
         p[0] = Fact(p[1])
         # p[0] = p[1]
 
     def p_rules_list(self, p):
         '''rules : rules rule'''
-        p[0] = p[1] + [p[2]]
+        p[1].append(p[2])
+        p[0] = p[1]
 
     def p_rules(self, p):
         '''rules :  rule'''
@@ -39,7 +63,18 @@ class Parser(object):
 
     def p_rule(self, p):
         '''rule : head IMPLICATION body DOT'''
-        p[0] = Rule(p[1], p[3], 'rule')
+        # The comparisons and the negated atoms are kept apart from the
+        # positive atoms of the body
+        check_no_aggregates(p[3])
+        body = [literal for literal in p[3] if literal.type not in ('comparison', 'negation')]
+        comparisons = [literal for literal in p[3] if literal.type == 'comparison']
+        negations = [literal for literal in p[3] if literal.type == 'negation']
+        p[0] = Rule(p[1], body, 'rule', comparisons, negations)
+
+    def p_query(self, p):
+        '''query : QUERY block DOT'''
+        check_no_aggregates([p[2]])
+        p[0] = Query(p[2], 'query')
 
     def p_head(self, p):
         '''head : block'''
@@ -53,10 +88,30 @@ class Parser(object):
         '''blocklist : blocklist COMMA block'''
         p[0] = p[1] + [p[3]]
 
+    def p_blocklist2(self, p):
+        '''blocklist : blocklist COMMA comparison'''
+        p[0] = p[1] + [p[3]]
+
     def p_blocklist3(self, p):
         '''blocklist : block'''
         p[0] = [p[1]]
 
+    def p_blocklist4(self, p):
+        '''blocklist : comparison'''
+        p[0] = [p[1]]
+
+    def p_blocklist5(self, p):
+        '''blocklist : blocklist COMMA NOT block'''
+        p[0] = p[1] + [Predicate(p[4].predicate, p[4].terms, 'negation')]
+
+    def p_blocklist6(self, p):
+        '''blocklist : NOT block'''
+        p[0] = [Predicate(p[2].predicate, p[2].terms, 'negation')]
+
+    def p_comparison(self, p):
+        '''comparison : atom COMPARISON atom'''
+        p[0] = Comparison(p[1], p[2], p[3])
+
     def p_block(self, p):
         '''block : CONSTANT LEFT_PAR atomlist RIGHT_PAR'''
         p[0] = Predicate(p[1], p[3], False)
@@ -69,6 +124,14 @@ class Parser(object):
         '''atomlist : atom'''
         p[0] = [p[1]]
 
+    def p_atomlist3(self, p):
+        '''atomlist : atomlist COMMA aggregate'''
+        p[0] = p[1] + [p[3]]
+
+    def p_atomlist4(self, p):
+        '''atomlist : aggregate'''
+        p[0] = [p[1]]
+
     def p_atomvariable(self, p):
         '''atom : VARIABLE'''
         p[0] = p[1]
@@ -78,6 +141,12 @@ class Parser(object):
         p[0] = p[1]
         # p[0] = "\'" + p[1] + "\'"
 
+    def p_aggregate(self, p):
+        '''aggregate : CONSTANT LEFT_PAR VARIABLE RIGHT_PAR'''
+        if p[1] not in AGGREGATE_FUNCTIONS:
+            raise Exception(f"Unknown aggregate {p[1]}, expected one of {', '.join(AGGREGATE_FUNCTIONS)}.")
+        p[0] = Aggregate(p[1], p[3])
+
     def p_error(self, p):
         raise Exception(f"Syntax error in input. {p}")
 
@@ -95,6 +164,34 @@ class Parser(object):
         '''
         self.parser = yacc.yacc(module=self, **kwargs)
 
+    def signature(self):
+        # The signature PLY computes for the grammar: the tokens followed by
+        # the docstrings of the production functions in source order
+        functions = [getattr(self, name) for name in dir(self) if name.startswith('p_') and name != 'p_error']
+        functions.sort(key=lambda function: function.__code__.co_firstlineno)
+        return ' '.join(sorted(self.tokens)) + ''.join(function.__doc__ for function in functions)
+
+    def build_from_tables(self):
+        '''
+        Builds the parser from the cached tables in parsetab.py, skipping the
+        grammar validation and debug output of yacc. If the tables are out of
+        date they are regenerated by building the parser with yacc.
+
+            Returns:
+                parser (ply.yacc.LRParser): Parser object
+        '''
+        table = yacc.LRTable()
+        try:
+            from . import parsetab
+            signature = table.read_table(parsetab)
+        except (ImportError, yacc.VersionError):
+            signature = None
+        if signature != self.signature():
+            self.build(debug=False, write_tables=True)
+            return
+        table.bind_callables({name: getattr(self, name) for name in dir(self) if name.startswith('p_')})
+        self.parser = yacc.LRParser(table, self.p_error)
+
     def test(self, data):
         '''
         Prints the parser output line by line.
@@ -6,9 +6,9 @@ _tabversion = '3.10'
 
 _lr_method = 'LALR'
 
-_lr_signature = 'COMMA CONSTANT DOT IMPLICATION LEFT_PAR RIGHT_PAR VARIABLEprogram : facts rules\n                | facts\n                | rulesfacts : facts factfacts :  factfact : block DOTrules : rules rulerules :  rulerule : head IMPLICATION body DOThead : blockbody : blocklistblocklist : blocklist COMMA blockblocklist : blockblock : CONSTANT LEFT_PAR atomlist RIGHT_PARatomlist : atomlist COMMA atomatomlist : atomatom : VARIABLEatom : CONSTANT'
+_lr_signature = 'COMMA COMPARISON CONSTANT DOT IMPLICATION LEFT_PAR NOT QUERY RIGHT_PAR VARIABLEprogram : facts rules\n                | facts\n                | rulesprogram : facts rules query\n                | facts query\n                | rules query\n                | queryfacts : facts factfacts :  factfact : block DOTrules : rules rulerules :  rulerule : head IMPLICATION body DOTquery : QUERY block DOThead : blockbody : blocklistblocklist : blocklist COMMA blockblocklist : blocklist COMMA comparisonblocklist : blockblocklist : comparisonblocklist : blocklist COMMA NOT blockblocklist : NOT blockcomparison : atom COMPARISON atomblock : CONSTANT LEFT_PAR atomlist RIGHT_PARatomlist : atomlist COMMA atomatomlist : atomatomlist : atomlist COMMA aggregateatomlist : aggregateatom : VARIABLEatom : CONSTANTaggregate : CONSTANT LEFT_PAR VARIABLE RIGHT_PAR'
     
-_lr_action_items = {'CONSTANT':([0,2,3,4,5,9,10,11,13,14,15,23,24,26,],[8,8,8,-5,-8,8,-4,-7,-6,8,19,-9,8,19,]),'$end':([1,2,3,4,5,9,10,11,13,23,],[0,-2,-3,-5,-8,-1,-4,-7,-6,-9,]),'DOT':([6,16,17,18,25,27,],[13,23,-11,-13,-14,-12,]),'IMPLICATION':([6,7,12,25,],[-10,14,-10,-14,]),'LEFT_PAR':([8,],[15,]),'VARIABLE':([15,26,],[22,22,]),'COMMA':([17,18,19,20,21,22,25,27,28,],[24,-13,-18,26,-16,-17,-14,-12,-15,]),'RIGHT_PAR':([19,20,21,22,28,],[-18,25,-16,-17,-15,]),}
+_lr_action_items = {'QUERY':([0,2,3,5,6,11,13,15,18,35,],[7,7,7,-9,-12,7,-8,-11,-10,-13,]),'CONSTANT':([0,2,3,5,6,7,11,13,15,18,19,20,27,35,36,38,41,44,],[10,10,10,-9,-12,10,10,-8,-11,-10,28,31,10,-13,28,46,31,10,]),'$end':([1,2,3,4,5,6,11,12,13,14,15,18,21,22,35,],[0,-2,-3,-7,-9,-12,-1,-5,-8,-6,-11,-10,-4,-14,-13,]),'DOT':([8,17,23,24,25,26,30,37,40,42,43,45,46,50,],[18,22,35,-16,-19,-20,-29,-22,-24,-17,-18,-23,-30,-21,]),'IMPLICATION':([8,9,16,40,],[-15,19,-15,-24,]),'LEFT_PAR':([10,28,31,],[20,20,39,]),'NOT':([19,36,],[27,44,]),'VARIABLE':([19,20,36,38,39,41,],[30,30,30,30,47,30,]),'COMMA':([24,25,26,30,31,32,33,34,37,40,42,43,45,46,48,49,50,51,],[36,-19,-20,-29,-30,41,-26,-28,-22,-24,-17,-18,-23,-30,-25,-27,-21,-31,]),'COMPARISON':([28,29,30,],[-30,38,-29,]),'RIGHT_PAR':([30,31,32,33,34,47,48,49,51,],[-29,-30,40,-26,-28,51,-25,-27,-31,]),}
 
 _lr_action = {}
 for _k, _v in _lr_action_items.items():
@@ -17,7 +17,7 @@ for _k, _v in _lr_action_items.items():
       _lr_action[_x][_k] = _y
 del _lr_action_items
 
-_lr_goto_items = {'program':([0,],[1,]),'facts':([0,],[2,]),'rules':([0,2,],[3,9,]),'fact':([0,2,],[4,10,]),'rule':([0,2,3,9,],[5,5,11,11,]),'block':([0,2,3,9,14,24,],[6,6,12,12,18,27,]),'head':([0,2,3,9,],[7,7,7,7,]),'body':([14,],[16,]),'blocklist':([14,],[17,]),'atomlist':([15,],[20,]),'atom':([15,26,],[21,28,]),}
+_lr_goto_items = {'program':([0,],[1,]),'facts':([0,],[2,]),'rules':([0,2,],[3,11,]),'query':([0,2,3,11,],[4,12,14,21,]),'fact':([0,2,],[5,13,]),'rule':([0,2,3,11,],[6,6,15,15,]),'block':([0,2,3,7,11,19,27,36,44,],[8,8,16,17,16,25,37,42,50,]),'head':([0,2,3,11,],[9,9,9,9,]),'body':([19,],[23,]),'blocklist':([19,],[24,]),'comparison':([19,36,],[26,43,]),'atom':([19,20,36,38,41,],[29,33,29,45,48,]),'atomlist':([20,],[32,]),'aggregate':([20,41,],[34,49,]),}
 
 _lr_goto = {}
 for _k, _v in _lr_goto_items.items():
@@ -27,22 +27,35 @@ for _k, _v in _lr_goto_items.items():
 del _lr_goto_items
 _lr_productions = [
   ("S' -> program","S'",1,None,None,None),
-  ('program -> facts rules','program',2,'p_program','parser.py',12),
-  ('program -> facts','program',1,'p_program','parser.py',13),
-  ('program -> rules','program',1,'p_program','parser.py',14),
-  ('facts -> facts fact','facts',2,'p_facts_list','parser.py',21),
-  ('facts -> fact','facts',1,'p_facts','parser.py',25),
-  ('fact -> block DOT','fact',2,'p_fact','parser.py',29),
-  ('rules -> rules rule','rules',2,'p_rules_list','parser.py',34),
-  ('rules -> rule','rules',1,'p_rules','parser.py',38),
-  ('rule -> head IMPLICATION body DOT','rule',4,'p_rule','parser.py',42),
-  ('head -> block','head',1,'p_head','parser.py',46),
-  ('body -> blocklist','body',1,'p_body','parser.py',50),
-  ('blocklist -> blocklist COMMA block','blocklist',3,'p_blocklist1','parser.py',54),
-  ('blocklist -> block','blocklist',1,'p_blocklist3','parser.py',58),
-  ('block -> CONSTANT LEFT_PAR atomlist RIGHT_PAR','block',4,'p_block','parser.py',62),
-  ('atomlist -> atomlist COMMA atom','atomlist',3,'p_atomlist1','parser.py',66),
-  ('atomlist -> atom','atomlist',1,'p_atomlist2','parser.py',70),
-  ('atom -> VARIABLE','atom',1,'p_atomvariable','parser.py',74),
-  ('atom -> CONSTANT','atom',1,'p_atomconstant','parser.py',78),
+  ('program -> facts rules','program',2,'p_program','parser.py',18),
+  ('program -> facts','program',1,'p_program','parser.py',19),
+  ('program -> rules','program',1,'p_program','parser.py',20),
+  ('program -> facts rules query','program',3,'p_program_query','parser.py',27),
+  ('program -> facts query','program',2,'p_program_query','parser.py',28),
+  ('program -> rules query','program',2,'p_program_query','parser.py',29),
+  ('program -> query','program',1,'p_program_query','parser.py',30),
+  ('facts -> facts fact','facts',2,'p_facts_list','parser.py',40),
+  ('facts -> fact','facts',1,'p_facts','parser.py',46),
+  ('fact -> block DOT','fact',2,'p_fact','parser.py',50),
+  ('rules -> rules rule','rules',2,'p_rules_list','parser.py',56),
+  ('rules -> rule','rules',1,'p_rules','parser.py',61),
+  ('rule -> head IMPLICATION body DOT','rule',4,'p_rule','parser.py',65),
+  ('query -> QUERY block DOT','query',3,'p_query','parser.py',75),
+  ('head -> block','head',1,'p_head','parser.py',80),
+  ('body -> blocklist','body',1,'p_body','parser.py',84),
+  ('blocklist -> blocklist COMMA block','blocklist',3,'p_blocklist1','parser.py',88),
+  ('blocklist -> blocklist COMMA comparison','blocklist',3,'p_blocklist2','parser.py',92),
+  ('blocklist -> block','blocklist',1,'p_blocklist3','parser.py',96),
+  ('blocklist -> comparison','blocklist',1,'p_blocklist4','parser.py',100),
+  ('blocklist -> blocklist COMMA NOT block','blocklist',4,'p_blocklist5','parser.py',104),
+  ('blocklist -> NOT block','blocklist',2,'p_blocklist6','parser.py',108),
+  ('comparison -> atom COMPARISON atom','comparison',3,'p_comparison','parser.py',112),
+  ('block -> CONSTANT LEFT_PAR atomlist RIGHT_PAR','block',4,'p_block','parser.py',116),
+  ('atomlist -> atomlist COMMA atom','atomlist',3,'p_atomlist1','parser.py',120),
+  ('atomlist -> atom','atomlist',1,'p_atomlist2','parser.py',124),
+  ('atomlist -> atomlist COMMA aggregate','atomlist',3,'p_atomlist3','parser.py',128),
+  ('atomlist -> aggregate','atomlist',1,'p_atomlist4','parser.py',132),
+  ('atom -> VARIABLE','atom',1,'p_atomvariable','parser.py',136),
+  ('atom -> CONSTANT','atom',1,'p_atomconstant','parser.py',140),
+  ('aggregate -> CONSTANT LEFT_PAR VARIABLE RIGHT_PAR','aggregate',4,'p_aggregate','parser.py',145),
 ]
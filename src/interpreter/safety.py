@@ -1,3 +1,7 @@
+from ..model.symbols import is_aggregate
+from ..engine.stratification import dependency_graph, strongly_connected_components, nonmonotonic_dependencies
+
+
 def check_safety_rules(facts, rules):
     # Check Rule 1: Facts should be ground
     for fact in facts:
@@ -7,11 +11,12 @@ def check_safety_rules(facts, rules):
                 raise Exception(
                     f"Safety Rule Violation: Fact {fact.fact.predicate} has variable {term} as a term.")
 
-    # Check Rule 2: Each variable in the head of a rule must occur in the body
-    # of the same rule
+    # Check Rule 2: Each variable in the head of a rule, also inside an
+    # aggregate, must occur in the positive body of the same rule
     for rule in rules:
+        head_terms = [term.variable if is_aggregate(term) else term for term in rule.head.terms]
         head_variables = [
-            term for term in rule.head.terms if term[0].isupper()]
+            term for term in head_terms if term[0].isupper()]
         body_variables = [
             term for predicate in rule.body for term in predicate.terms if term[0].isupper()]
 
@@ -19,3 +24,46 @@ def check_safety_rules(facts, rules):
             if head_var not in body_variables:
                 raise Exception(
                     f"Safety Rule Violation: Variable {head_var} in head of rule {rule.head.predicate} does not occur in the body.")
+
+    # Check Rule 3: Each variable of a comparison must occur in a relational
+    # atom of the body, since comparisons only filter bound values
+    for rule in rules:
+        if not rule.body:
+            raise Exception(
+                f"Safety Rule Violation: Rule {rule.head.predicate} has no relational atom in the body.")
+        body_variables = [
+            term for predicate in rule.body for term in predicate.terms if term[0].isupper()]
+        for comparison in rule.comparisons:
+            for term in comparison.terms:
+                if term[0].isupper() and term not in body_variables:
+                    raise Exception(
+                        f"Safety Rule Violation: Variable {term} in comparison {comparison} of rule {rule.head.predicate} does not occur in a relational atom of the body.")
+
+
+    # Check Rule 4: Each variable of a negated atom must occur in the
+    # positive body, since negated atoms only filter bound values
+    for rule in rules:
+        body_variables = [
+            term for predicate in rule.body for term in predicate.terms if term[0].isupper()]
+        for negation in rule.negations:
+            for term in negation.terms:
+                if term[0].isupper() and term not in body_variables:
+                    raise Exception(
+                        f"Safety Rule Violation: Variable {term} in negated atom {negation.predicate} of rule {rule.head.predicate} does not occur in a positive atom of the body.")
+
+
+def check_stratification(rules):
+    # A predicate which is negated or aggregated over must be complete before
+    # the rule reading it is evaluated, so it cannot depend on the head of
+    # that rule: it must belong to an earlier stratum
+    graph = dependency_graph(rules)
+    components = {}
+    for i, component in enumerate(strongly_connected_components(graph)):
+        for predicate in component:
+            components[predicate] = i
+    for rule in rules:
+        head = rule.head.predicate
+        for predicate in sorted(nonmonotonic_dependencies(rule)):
+            if components.get(predicate) == components[head]:
+                raise Exception(
+                    f"Stratification Violation: Rule {head} depends on {predicate} through negation or aggregation within a recursive cycle.")
@@ -0,0 +1,139 @@
+from .tokenizer import Tokenizer
+
+
+class Token(object):
+    '''
+    A token with the same attributes and representation as the tokens of
+    the PLY lexer, so that the parser and its error messages cannot tell
+    them apart.
+    '''
+    def __init__(self, type, value, lineno, lexpos):
+        self.type = type
+        self.value = value
+        self.lineno = lineno
+        self.lexpos = lexpos
+
+    def __str__(self):
+        return "LexToken(%s,%r,%d,%d)" % (self.type, self.value, self.lineno, self.lexpos)
+
+    def __repr__(self):
+        return str(self)
+
+
+# Single character tokens
+PUNCTUATION = {
+    '.': 'DOT',
+    '(': 'LEFT_PAR',
+    ')': 'RIGHT_PAR',
+    ',': 'COMMA',
+}
+
+# Two character tokens
+OPERATORS = {
+    ':-': 'IMPLICATION',
+    '?-': 'QUERY',
+    '!=': 'COMPARISON',
+    '<=': 'COMPARISON',
+    '>=': 'COMPARISON',
+}
+
+# Single character comparison operators, which are tried after the two
+# character ones
+COMPARISONS = {
+    '=': 'COMPARISON',
+    '<': 'COMPARISON',
+    '>': 'COMPARISON',
+}
+
+UPPERCASE = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+LOWERCASE = frozenset("abcdefghijklmnopqrstuvwxyz")
+CONSTANT_START = frozenset("abcdefghijklmnopqrstuvwxyz0123456789")
+VARIABLE_PART = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_")
+CONSTANT_PART = VARIABLE_PART | {'.'}
+
+
+class Scanner(object):
+    '''
+    A hand-written single-pass scanner for the token set of the Tokenizer.
+    It has the input/token interface of a PLY lexer and can be passed to the
+    parser instead of it, without building the lexer by reflection.
+    '''
+    tokens = Tokenizer.tokens
+
+    def __init__(self):
+        self.data = ""
+        self.lexpos = 0
+        self.lineno = 1
+
+    def build(self, **kwargs):
+        # The scanner needs no building; kept for symmetry with the Tokenizer
+        self.lexer = self
+
+    def input(self, data):
+        self.data = data
+        self.lexpos = 0
+        self.lineno = 1
+
+    def token(self):
+        '''
+        Returns the next token of the input.
+
+            Returns:
+                token (Token): Next token, or None at the end of the input
+        '''
+        data = self.data
+        length = len(data)
+        position = self.lexpos
+        while position < length:
+            char = data[position]
+            if char == ' ' or char == '\t':
+                position += 1
+            elif char == '\n':
+                self.lineno += 1
+                position += 1
+            elif char == '%':
+                # Comments run until the end of the line
+                end = data.find('\n', position)
+                position = length if end == -1 else end
+            elif char in PUNCTUATION:
+                self.lexpos = position + 1
+                return Token(PUNCTUATION[char], char, self.lineno, position)
+            elif data[position:position + 2] in OPERATORS:
+                self.lexpos = position + 2
+                return Token(OPERATORS[data[position:position + 2]], data[position:position + 2], self.lineno, position)
+            elif char in COMPARISONS:
+                self.lexpos = position + 1
+                return Token(COMPARISONS[char], char, self.lineno, position)
+            elif char in UPPERCASE or char in CONSTANT_START:
+                part = VARIABLE_PART if char in UPPERCASE else CONSTANT_PART
+                end = position + 1
+                while end < length and data[end] in part:
+                    end += 1
+                # A constant cannot end with a dot, which ends the rule in
+                # X < 100.
+                while data[end - 1] == '.':
+                    end -= 1
+                self.lexpos = end
+                type = 'VARIABLE' if char in UPPERCASE else 'CONSTANT'
+                if data[position:end] == 'not':
+                    # not is a keyword only in front of an atom, so that it
+                    # can still be a constant or the name of a predicate
+                    next = end
+                    while next < length and data[next] in ' \t':
+                        next += 1
+                    if next > end and next < length and data[next] in LOWERCASE:
+                        type = 'NOT'
+                return Token(type, data[position:end], self.lineno, position)
+            else:
+                raise Exception(f"Illegal character: {char}")
+        self.lexpos = position
+        return None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        token = self.token()
+        if token is None:
+            raise StopIteration
+        return token
@@ -2,13 +2,15 @@ import ply.lex as lex
 
 
 class Tokenizer(object):
-    # TODO: Do we need a token for query?
     tokens = [
         'IMPLICATION',  #:-
+        'QUERY',        #?-
         'DOT',          #.
         'LEFT_PAR',     #(
         'RIGHT_PAR',    #)
         'COMMA',        #,
+        'COMPARISON',   # =, !=, <, <=, >, >=
+        'NOT',          # not, before a negated atom
         'CONSTANT',     # Begins with a lowercase letter
         'VARIABLE',     # Begins with an uppercase letter
     ]
@@ -18,12 +20,21 @@ class Tokenizer(object):
 
     # Tokens' regular expressions
     t_IMPLICATION = r'\:\-'
+    t_QUERY = r'\?\-'
     t_DOT = r'\.'
     t_LEFT_PAR = r'\('
     t_RIGHT_PAR = r'\)'
     t_COMMA = r'\,'
+    t_COMPARISON = r'\!\=|\<\=|\>\=|\=|\<|\>'
     t_VARIABLE = r'[A-Z][A-Za-z0-9_]*'
-    t_CONSTANT = r'[a-z0-9][a-zA-Z0-9_.]*'
+    # A constant cannot end with a dot, which ends the rule in X < 100.
+    t_CONSTANT = r'[a-z0-9]([a-zA-Z0-9_.]*[a-zA-Z0-9_])?'
+
+    def t_NOT(self, t):
+        # not is a keyword only in front of an atom, so that it can still be
+        # a constant or the name of a predicate
+        r'not(?=[ \t]+[a-z])'
+        return t
 
     def t_comment(self, t):
         r"[ ]*\%[^\n]*"  #
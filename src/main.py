@@ -1,36 +1,64 @@
 import argparse
 import sys
-from .interpreter.tokenizer import Tokenizer
+from .interpreter.scanner import Scanner
 from .interpreter.parser import Parser
-from .engine.naive import naive_evaluation
-from .engine.seminaive import semi_naive_evaluation
 from .utilities.timer import Timer
-from .interpreter.safety import check_safety_rules
+from .interpreter.safety import check_safety_rules, check_stratification
+from .interpreter.loader import parse_fact_sources, load_relations
+from .engine.stratification import is_monotonic
+from .utilities.writer import write_facts
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Evaluate a Datalog program.")
     parser.add_argument("file", type=str, help="The name of the file containing the Datalog program.")
-    parser.add_argument("method", type=str, choices=["naive", "seminaive"], help="The method of evaluation (naive or seminaive).")
+    parser.add_argument("method", type=str, choices=["naive", "seminaive", "columnar", "sqlite"], help="The method of evaluation (naive, seminaive, columnar or sqlite).")
     parser.add_argument("--output", type=str, default="output.txt", help="The name of the file to which the output will be written (default: output.txt).")
     parser.add_argument("--verbose", action="store_true", default=False, help="Enable verbose output")
+    parser.add_argument("--facts", action="append", default=[], metavar="PREDICATE=PATH", help="Loads the base facts of a predicate from a .tsv or .csv file (can be repeated).")
+    parser.add_argument("--workers", type=int, default=1, help="The number of worker processes of the seminaive method (default: 1).")
+    parser.add_argument("--predicates", nargs="+", metavar="PREDICATE", help="Only writes the facts of these predicates to the output.")
+    parser.add_argument("--sort", action="store_true", default=False, help="Writes the predicates and their facts in sorted order.")
+    parser.add_argument("--save-snapshot", type=str, metavar="PATH", help="Saves the materialized database to a binary snapshot (seminaive only).")
+    parser.add_argument("--load-snapshot", type=str, metavar="PATH", help="Continues the evaluation from a binary snapshot (seminaive only).")
+    parser.add_argument("--database", type=str, metavar="PATH", help="The SQLite database file in which the relations are stored (sqlite only, default: a temporary file).")
+    parser.add_argument("--trace", type=str, metavar="PATH", help="Writes the per-rule and per-iteration statistics of the evaluation as JSON (naive and seminaive only).")
+    parser.add_argument("--batch-size", type=int, default=1024, metavar="N", help="The number of partial matches passed between the join steps of the naive method at a time (default: 1024).")
+    parser.add_argument("--sort-memory", type=int, default=256, metavar="MB", help="The memory budget of sorting in megabytes, above which the facts are sorted on disk (default: 256).")
 
     args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.workers > 1 and args.method != "seminaive":
+        parser.error("--workers is only supported by the seminaive method")
+    if (args.save_snapshot or args.load_snapshot) and (args.method != "seminaive" or args.workers > 1):
+        parser.error("snapshots are only supported by the seminaive method")
+    if args.trace and (args.method not in ("naive", "seminaive") or args.workers > 1):
+        parser.error("--trace is only supported by the naive and seminaive methods")
+    if args.database and args.method != "sqlite":
+        parser.error("--database is only supported by the sqlite method")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.sort_memory < 1:
+        parser.error("--sort-memory must be at least 1")
 
     program = ""
     with open(args.file) as f:
         program = f.read()
 
-    tokenizer = Tokenizer()
-    tokenizer.build()
+    # The hand-written scanner and the cached parser tables avoid building
+    # the lexer and the parser by reflection on every run
+    scanner = Scanner()
+    scanner.build()
 
-    parser = Parser(tokenizer)
-    parser.build(debug=True)
+    parser = Parser(scanner)
+    parser.build_from_tables()
 
     facts = []
     rules = []
+    queries = []
     try:
-        parsedProgram = parser.parser.parse(program)
+        parsedProgram = parser.parser.parse(program, lexer=scanner)
         if not parsedProgram:
             raise Exception("Unknown error while parsing program.")
         for p in parsedProgram:
@@ -38,20 +66,73 @@ if __name__ == '__main__':
                 facts.append(p)
             elif p.type == 'rule':
                 rules.append(p)
+            elif p.type == 'query':
+                queries.append(p)
 
         check_safety_rules(facts, rules)
+        check_stratification(rules)
+        base_relations = load_relations(parse_fact_sources(args.facts))
+        snapshot = None
+        if args.load_snapshot:
+            from .engine.snapshot import load_snapshot
+            snapshot = load_snapshot(args.load_snapshot)
     except Exception as e:
         print(e)
         sys.exit(1)
 
-    database = ""
-    if args.method == "naive":
+    if queries and (args.method != "seminaive" or args.workers > 1):
+        print("Queries are only supported by the seminaive method.")
+        sys.exit(1)
+    if not is_monotonic(rules) and (args.method != "seminaive" or args.workers > 1):
+        print("Negation and aggregates are only supported by the seminaive method.")
+        sys.exit(1)
+    if queries and args.save_snapshot:
+        print("A snapshot cannot be saved when answering a query.")
+        sys.exit(1)
+
+    trace = None
+    if args.trace:
+        from .engine.trace import Trace
+        trace = Trace()
+
+    # The engines are imported on demand, so that only the selected one and
+    # its dependencies (NumPy, multiprocessing, SQLite) are loaded
+    if queries:
+        from .engine.magic import query_fixpoint
+        with Timer("Query evaluation"):
+            derived, symbols = query_fixpoint(facts, rules, queries[0], args.verbose, base_relations, snapshot, trace)
+
+    elif args.method == "naive":
+        from .engine.naive import naive_fixpoint
         with Timer("Naive evaluation"):
-            database = naive_evaluation(facts, rules, args.verbose)
+            derived, symbols = naive_fixpoint(facts, rules, args.verbose, base_relations=base_relations, trace=trace,
+                                             batch_size=args.batch_size)
+
+    elif args.method == "columnar":
+        from .engine.columnar import columnar_fixpoint
+        with Timer("Columnar evaluation"):
+            derived, symbols = columnar_fixpoint(facts, rules, args.verbose, base_relations=base_relations)
+
+    elif args.method == "sqlite":
+        from .engine.sql import sql_fixpoint
+        with Timer("SQLite evaluation"):
+            derived, symbols = sql_fixpoint(facts, rules, args.verbose, base_relations, args.database)
+
+    elif args.workers > 1:
+        from .engine.parallel import parallel_semi_naive_fixpoint
+        with Timer(f"Parallel semi-naive evaluation ({args.workers} workers)"):
+            derived, symbols = parallel_semi_naive_fixpoint(facts, rules, args.verbose, args.workers, base_relations)
 
     else:
+        from .engine.seminaive import semi_naive_fixpoint
         with Timer("Semi-naive evaluation"):
-            database = semi_naive_evaluation(facts, rules, args.verbose)
+            derived, symbols = semi_naive_fixpoint(facts, rules, args.verbose, base_relations=base_relations,
+                                                   snapshot=snapshot, snapshot_path=args.save_snapshot, trace=trace)
+
+    if trace is not None:
+        trace.save(args.trace)
 
-    with open(args.output, 'w') as file:
-        file.write(database)
+    # The facts are formatted and written one at a time instead of building
+    # the whole output in memory
+    predicates = set(args.predicates) if args.predicates else None
+    write_facts(args.output, derived, symbols, predicates, args.sort, args.sort_memory * 1024 * 1024)
@@ -1,57 +1,193 @@
+# Immutable objects assign their slots once, bypassing their __setattr__
+set_attribute = object.__setattr__
+
+# Functions of the aggregates in rule heads
+AGGREGATE_FUNCTIONS = ("count", "sum", "min", "max")
+
+
 class Rule(object):
-    def __init__(self, head={}, body={}, type="rule"):
+    # The body holds the positive relational atoms of the rule. The built-in
+    # comparison atoms and the negated atoms are kept apart, since they only
+    # filter the matches of the body
+    __slots__ = ("head", "body", "type", "comparisons", "negations")
+
+    def __init__(self, head={}, body={}, type="rule", comparisons=(), negations=()):
         self.head = head
         self.body = body
         self.type = type
+        self.comparisons = list(comparisons)
+        self.negations = list(negations)
 
     def __repr__(self):
-        return "%r" % (self.__dict__)
+        return "%r" % ({'head': self.head, 'body': self.body, 'comparisons': self.comparisons,
+                        'negations': self.negations, 'type': self.type})
 
 
 class Fact(object):
+    '''
+    A ground atom stated in the program. Facts are immutable; the atom of a
+    fact carries the type of the fact, and the hash is computed once.
+    '''
+    __slots__ = ("fact", "type", "_hash")
+
     def __init__(self, fact, type="fact"):
-        self.fact = fact
-        self.fact.type = type
-        self.type = type
+        if fact.type != type:
+            fact = Predicate(fact.predicate, fact.terms, type)
+        set_attribute(self, "fact", fact)
+        set_attribute(self, "type", type)
+        set_attribute(self, "_hash", hash((fact._hash, type)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+            return self._hash == other._hash and self.fact == other.fact and self.type == other.type
         else:
             return False
 
     def __hash__(self):
-        return hash(
-            (self.fact.predicate,
-             tuple(
-                 self.fact.terms),
-                self.fact.type,
-                self.type))
+        return self._hash
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __reduce__(self):
+        return (self.__class__, (self.fact, self.type))
+
     def __repr__(self):
-        return "%r" % (self.__dict__)
+        return "%r" % ({'fact': self.fact, 'type': self.type})
 
 
-class Predicate(object):
-    def __init__(self, name="", terms=[], type="predicate"):
-        self.predicate = name
-        self.terms = terms
+class Query(object):
+    __slots__ = ("query", "type")
+
+    def __init__(self, query, type="query"):
+        self.query = query
         self.type = type
 
+    def __repr__(self):
+        return "%r" % ({'query': self.query, 'type': self.type})
+
+
+class Predicate(object):
+    '''
+    An atom: a predicate applied to a tuple of terms. Atoms are immutable and
+    compute their hash once, since the engines keep them in sets and use them
+    as keys.
+    '''
+    __slots__ = ("predicate", "terms", "type", "_hash")
+
+    def __init__(self, name="", terms=(), type="predicate"):
+        terms = tuple(terms)
+        set_attribute(self, "predicate", name)
+        set_attribute(self, "terms", terms)
+        set_attribute(self, "type", type)
+        set_attribute(self, "_hash", hash((name, terms, type)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+            return (self._hash == other._hash and self.predicate == other.predicate
+                    and self.terms == other.terms and self.type == other.type)
         else:
             return False
 
     def __hash__(self):
-        return hash((self.predicate, tuple(self.terms), self.type))
+        return self._hash
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __reduce__(self):
+        return (self.__class__, (self.predicate, self.terms, self.type))
+
+    def __repr__(self):
+        # The terms are shown as a list, as they are written in the program
+        return "%r" % ({'predicate': self.predicate, 'terms': list(self.terms), 'type': self.type})
+
+
+class Comparison(object):
+    '''
+    A built-in comparison atom such as X < 100 or X != Y, with one of the
+    operators =, !=, <, <=, > and >=. Its terms are variables or constants;
+    the constants are never interned, since they need not occur in any fact.
+    '''
+    __slots__ = ("left", "operator", "right", "type", "_hash")
+
+    def __init__(self, left, operator, right, type="comparison"):
+        set_attribute(self, "left", left)
+        set_attribute(self, "operator", operator)
+        set_attribute(self, "right", right)
+        set_attribute(self, "type", type)
+        set_attribute(self, "_hash", hash((left, operator, right, type)))
+
+    @property
+    def terms(self):
+        return (self.left, self.right)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return (self._hash == other._hash and self.left == other.left and self.operator == other.operator
+                    and self.right == other.right and self.type == other.type)
+        else:
+            return False
+
+    def __hash__(self):
+        return self._hash
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __reduce__(self):
+        return (self.__class__, (self.left, self.operator, self.right, self.type))
+
+    def __str__(self):
+        return f"{self.left} {self.operator} {self.right}"
+
+    def __repr__(self):
+        return "%r" % ({'left': self.left, 'operator': self.operator, 'right': self.right, 'type': self.type})
+
+
+class Aggregate(object):
+    '''
+    An aggregate term in the head of a rule, such as count(Y) in
+    degree(X, count(Y)) :- edge(X, Y). The other terms of the head group the
+    matches of the body, and the function is applied to the values of the
+    variable over the matches of each group.
+    '''
+    __slots__ = ("function", "variable", "_hash")
+
+    def __init__(self, function, variable):
+        set_attribute(self, "function", function)
+        set_attribute(self, "variable", variable)
+        set_attribute(self, "_hash", hash((function, variable)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return self.function == other.function and self.variable == other.variable
+        else:
+            return False
+
+    def __hash__(self):
+        return self._hash
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __reduce__(self):
+        return (self.__class__, (self.function, self.variable))
+
+    def __str__(self):
+        return f"{self.function}({self.variable})"
+
     def __repr__(self):
-        return "%r" % (self.__dict__)
+        return "%r" % ({'function': self.function, 'variable': self.variable})
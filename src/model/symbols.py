@@ -0,0 +1,100 @@
+import re
+from .model import Predicate, Rule, Aggregate
+
+
+# Constants written as integers or decimals are numbers
+NUMBER = re.compile(r"-?[0-9]+(\.[0-9]+)?")
+
+
+def is_variable(term):
+    # Interned constants are integers, variables stay strings
+    return isinstance(term, str) and term[0].isupper()
+
+
+def is_aggregate(term):
+    return isinstance(term, Aggregate)
+
+
+def term_value(term):
+    '''
+    Returns the typed value of a constant, by which the comparisons order
+    it. Numbers compare by their value and come before all other constants,
+    which compare as strings, so 9 < 10 < a.
+
+        Args:
+            term (str): Constant as written in the program
+
+        Returns:
+            value (tuple): Type rank and value of the constant
+    '''
+    if NUMBER.fullmatch(term):
+        return (0, float(term) if "." in term else int(term))
+    return (1, term)
+
+
+class SymbolTable(object):
+    '''
+    Maps the constants of a program to dense integer IDs, so that the engines
+    store and join integer tuples. The IDs are decoded back to the constants
+    only when the result is written out.
+    '''
+    def __init__(self, symbols=()):
+        self.symbols = list(symbols)
+        self.ids = {symbol: id for id, symbol in enumerate(self.symbols)}
+        self.typed_values = []
+
+    def intern(self, symbol):
+        '''
+        Returns the ID of a constant, assigning the next free ID if needed.
+
+            Args:
+                symbol (str): Constant which is to be interned
+
+            Returns:
+                id (int): ID of the constant
+        '''
+        id = self.ids.get(symbol)
+        if id is None:
+            id = len(self.symbols)
+            self.ids[symbol] = id
+            self.symbols.append(symbol)
+        return id
+
+    def symbol(self, id):
+        return self.symbols[id]
+
+    def values(self):
+        '''
+        Returns the typed values of the constants, indexed by their IDs. The
+        values are computed when they are first needed, and the same list is
+        extended in place as more constants are interned.
+
+            Returns:
+                values (list): Typed values of the interned constants
+        '''
+        values = self.typed_values
+        if len(values) < len(self.symbols):
+            values.extend(term_value(symbol) for symbol in self.symbols[len(values):])
+        return values
+
+    def encode(self, terms):
+        return tuple(self.intern(term) for term in terms)
+
+    def decode(self, fact):
+        symbols = self.symbols
+        return tuple(symbols[id] for id in fact)
+
+    def encode_predicate(self, predicate):
+        # Interns the constants of a predicate and keeps its variables and
+        # the aggregates of a rule head
+        terms = [term if is_variable(term) or is_aggregate(term) else self.intern(term) for term in predicate.terms]
+        return Predicate(predicate.predicate, terms, predicate.type)
+
+    def encode_rule(self, rule):
+        return Rule(self.encode_predicate(rule.head),
+                    [self.encode_predicate(predicate) for predicate in rule.body],
+                    rule.type, rule.comparisons,
+                    [self.encode_predicate(predicate) for predicate in rule.negations])
+
+    def __len__(self):
+        return len(self.symbols)
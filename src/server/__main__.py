@@ -0,0 +1,38 @@
+import argparse
+import asyncio
+import sys
+from ..interpreter.loader import parse_fact_sources, load_relations
+from ..utilities.timer import Timer
+from .server import DatalogServer
+
+
+def listening_message(server):
+    addresses = ", ".join(str(socket.getsockname()) for socket in server.sockets)
+    print(f"Serving on {addresses}", flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the materialized fixpoint of a Datalog program.")
+    parser.add_argument("file", type=str, help="The name of the file containing the Datalog program.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="The address of the TCP socket (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=7474, help="The port of the TCP socket (default: 7474).")
+    parser.add_argument("--unix", type=str, metavar="PATH", help="Listens on a Unix socket at this path instead of a TCP socket.")
+    parser.add_argument("--facts", action="append", default=[], metavar="PREDICATE=PATH", help="Loads the base facts of a predicate from a .tsv or .csv file (can be repeated).")
+
+    args = parser.parse_args()
+
+    with open(args.file) as f:
+        program = f.read()
+
+    try:
+        server = DatalogServer()
+        with Timer("Materialization"):
+            server.load(program, load_relations(parse_fact_sources(args.facts)))
+    except Exception as e:
+        print(e)
+        sys.exit(1)
+
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix, listening_message))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,203 @@
+import asyncio
+from ..interpreter.scanner import Scanner
+from ..interpreter.parser import Parser
+from ..interpreter.safety import check_safety_rules, check_stratification
+from ..engine.incremental import IncrementalSession
+from ..model.model import Fact, Predicate
+from ..model.symbols import is_variable
+from ..utilities.writer import format_facts
+
+
+# Number of response lines written before the server waits for the client
+# to read them
+WRITE_CHUNK = 1024
+
+# Number of parsed query patterns kept, since clients tend to repeat the
+# same lookups
+PATTERN_CACHE_SIZE = 4096
+
+
+class DatalogServer(object):
+    '''
+    Keeps the materialized fixpoint of a program in memory and serves it to
+    clients over a line protocol, with one request per line:
+
+        ?- p(a, Y).            the facts of p matching the pattern
+        + p(a, b). p(b, c).    inserts a batch of facts
+        - p(a, b).             deletes a batch of facts
+
+    The response to a query is the matching facts, one per line, followed
+    by "ok N" with the number of facts. An update is answered by "ok N" with
+    the number of facts in the batch, and a failed request by "error" and a
+    message. The requests of all connections are handled one at a time on
+    the event loop, so every query sees the database between two complete
+    updates.
+    '''
+    def __init__(self):
+        self.scanner = Scanner()
+        self.scanner.build()
+        self.parser = Parser(self.scanner)
+        self.parser.build_from_tables()
+        self.session = IncrementalSession([])
+        self.patterns = {}
+
+    def load(self, program, base_relations=None):
+        '''
+        Materializes the fixpoint of a program, replacing the current one.
+
+            Args:
+                program (str): Facts and rules of the program
+                base_relations (dict): Maps predicates to iterables of tuples
+                                       of terms which are loaded as base facts
+
+            Returns:
+                None
+        '''
+        parsed = self.parse(program) if program.strip() else []
+        if any(p.type == 'query' for p in parsed):
+            raise Exception("The program of the server cannot contain a query.")
+        facts = [p for p in parsed if p.type == 'fact']
+        rules = [p for p in parsed if p.type == 'rule']
+        check_safety_rules(facts, rules)
+        check_stratification(rules)
+        for name, rows in (base_relations or {}).items():
+            facts.extend(Fact(Predicate(name, row)) for row in rows)
+        self.session = IncrementalSession(rules, facts)
+
+    def parse(self, text):
+        parsed = self.parser.parser.parse(text, lexer=self.scanner)
+        if not parsed:
+            raise Exception("Unknown error while parsing request.")
+        return parsed
+
+    def lookup(self, pattern):
+        '''
+        Returns the tuples of the materialized relation of a pattern which
+        match it, through an index on the columns of its constants.
+
+            Args:
+                pattern (Predicate): Predicate whose terms are constants and
+                                     variables
+
+            Returns:
+                tuples (list): Matching tuples of interned terms
+        '''
+        relation = self.session.database.get(pattern.predicate)
+        if relation is None:
+            return []
+        stable = relation.stable
+        sample = next(iter(stable), None)
+        if sample is None or len(sample) != len(pattern.terms):
+            return []
+
+        columns = []
+        key = []
+        repeated = []
+        first_column = {}
+        for column, term in enumerate(pattern.terms):
+            if not is_variable(term):
+                id = self.session.symbols.ids.get(term)
+                if id is None:
+                    # A constant which was never interned matches no tuple
+                    return []
+                columns.append(column)
+                key.append(id)
+            elif term in first_column:
+                repeated.append((first_column[term], column))
+            else:
+                first_column[term] = column
+
+        matches = stable.lookup(tuple(columns), tuple(key))
+        if repeated:
+            return [fact for fact in matches if all(fact[i] == fact[j] for i, j in repeated)]
+        return list(matches)
+
+    def parse_query(self, line):
+        pattern = self.patterns.get(line)
+        if pattern is None:
+            parsed = self.parse(line)
+            if len(parsed) != 1 or parsed[0].type != 'query':
+                raise Exception("Expected a single query.")
+            if len(self.patterns) >= PATTERN_CACHE_SIZE:
+                self.patterns.clear()
+            pattern = self.patterns[line] = parsed[0].query
+        return pattern
+
+    def query(self, pattern):
+        return format_facts({pattern.predicate: self.lookup(pattern)}, self.session.symbols)
+
+    def update(self, text, insert):
+        facts = self.parse(text)
+        if any(fact.type != 'fact' for fact in facts):
+            raise Exception("Only facts can be inserted or deleted.")
+        check_safety_rules(facts, [])
+        if insert:
+            self.session.insert(facts)
+        else:
+            self.session.delete(facts)
+        return len(facts)
+
+    def handle_request(self, line):
+        '''
+        Answers one request of the line protocol.
+
+            Args:
+                line (str): Request without the line break
+
+            Returns:
+                lines (list): Response lines, the last of which is the status
+        '''
+        try:
+            if line.startswith("?-"):
+                lines = list(self.query(self.parse_query(line)))
+                lines.append(f"ok {len(lines)}")
+                return lines
+            if line.startswith("+"):
+                return [f"ok {self.update(line[1:], True)}"]
+            if line.startswith("-"):
+                return [f"ok {self.update(line[1:], False)}"]
+            raise Exception("Unknown request, expected ?- query, + facts or - facts.")
+        except Exception as e:
+            return [f"error {e}"]
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                data = await reader.readline()
+                if not data:
+                    break
+                line = data.decode().strip()
+                if not line:
+                    continue
+                lines = self.handle_request(line)
+                for start in range(0, len(lines), WRITE_CHUNK):
+                    writer.write("".join(f"{response}\n" for response in lines[start:start + WRITE_CHUNK]).encode())
+                    await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=0, path=None):
+        '''
+        Starts listening on a TCP port, or on a Unix socket if a path is
+        given.
+
+            Args:
+                host (str): Address of the TCP socket
+                port (int): Port of the TCP socket, 0 for any free port
+                path (str): Path of the Unix socket
+
+            Returns:
+                server (asyncio.Server): Listening server
+        '''
+        if path:
+            return await asyncio.start_unix_server(self.handle_connection, path=path)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def serve(self, host="127.0.0.1", port=0, path=None, ready=None):
+        server = await self.start(host, port, path)
+        if ready is not None:
+            ready(server)
+        async with server:
+            await server.serve_forever()
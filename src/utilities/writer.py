@@ -0,0 +1,115 @@
+import heapq
+import tempfile
+
+
+# Default number of bytes of formatted facts which are sorted in memory
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+
+# Estimated memory used by a string object besides its characters
+STRING_OVERHEAD = 50
+
+
+def format_facts(derived, symbols, predicates=None):
+    '''
+    Formats the derived facts one at a time, predicate by predicate.
+
+        Args:
+            derived (dict): Maps each predicate to an iterable of tuples of
+                            interned terms
+            symbols (SymbolTable): Symbol table of the interned terms
+            predicates (set): Predicates which are to be formatted, or None
+                              for all of them
+
+        Returns:
+            facts (generator): Facts in Datalog format
+    '''
+    symbols = symbols.symbols
+    for predicate, facts in derived.items():
+        if predicates is not None and predicate not in predicates:
+            continue
+        for fact in facts:
+            terms = ", ".join([symbols[id] for id in fact])
+            yield f"{predicate}({terms})."
+
+
+def spill_run(lines):
+    # Writes a sorted run to a temporary file, which is removed when closed
+    run = tempfile.TemporaryFile(mode="w+")
+    run.writelines(f"{line}\n" for line in lines)
+    run.seek(0)
+    return run
+
+
+def external_sort(lines, memory_budget=DEFAULT_MEMORY_BUDGET):
+    '''
+    Sorts lines in memory while they fit into the memory budget, and with an
+    external merge sort otherwise: sorted runs of the budget size are spilled
+    to temporary files and merged.
+
+        Args:
+            lines (iterable): Lines without line breaks
+            memory_budget (int): Estimated number of bytes which may be held
+                                 in memory
+
+        Returns:
+            lines (generator): Sorted lines
+    '''
+    runs = []
+    chunk = []
+    size = 0
+    try:
+        for line in lines:
+            chunk.append(line)
+            size += len(line) + STRING_OVERHEAD
+            if size >= memory_budget:
+                chunk.sort()
+                runs.append(spill_run(chunk))
+                chunk = []
+                size = 0
+        chunk.sort()
+        if not runs:
+            yield from chunk
+            return
+        if chunk:
+            runs.append(spill_run(chunk))
+            chunk = []
+        for line in heapq.merge(*runs):
+            yield line[:-1]
+    finally:
+        for run in runs:
+            run.close()
+
+
+def write_facts(path, derived, symbols, predicates=None, sort=False, memory_budget=DEFAULT_MEMORY_BUDGET):
+    '''
+    Streams the derived facts to a file through a buffered writer, without
+    building the whole output in memory.
+
+        Args:
+            path (str): Path of the output file
+            derived (dict): Maps each predicate to an iterable of tuples of
+                            interned terms
+            symbols (SymbolTable): Symbol table of the interned terms
+            predicates (set): Predicates which are to be written, or None for
+                              all of them
+            sort (Boolean): Writes the predicates in alphabetical order and
+                            the facts of each predicate in sorted order
+            memory_budget (int): Estimated number of bytes of facts which are
+                                 sorted in memory before spilling to disk
+
+        Returns:
+            count (int): Number of facts written
+    '''
+    count = 0
+    with open(path, "w", buffering=1024 * 1024) as file:
+        if sort:
+            groups = (external_sort(format_facts({predicate: derived[predicate]}, symbols, predicates), memory_budget)
+                      for predicate in sorted(derived))
+        else:
+            groups = (format_facts({predicate: facts}, symbols, predicates) for predicate, facts in derived.items())
+        for lines in groups:
+            for line in lines:
+                file.write(line)
+                file.write("\n")
+                count += 1
+    return count